@@ -0,0 +1,168 @@
+"""Vectorized 1D peak fitting of many patches at once
+
+The models match those of hexrd.fitting.fitpeak:
+
+    'gaussian': [A, x0, FWHM, c0, c1]
+    'pvoigt':   [A, x0, FWHM, n, c0, c1]
+
+where A is the peak height, n the Lorentzian fraction, and c0 + c1 * x
+a linear background. All functions take a stack of patches: x and y
+have the shape (npatches, npts), and parameters (npatches, nparams).
+"""
+import numpy as np
+
+FOUR_LN2 = 4. * np.log(2.)
+
+NUM_PARAMS = {
+    'gaussian': 5,
+    'pvoigt': 6,
+}
+
+
+def _profiles(x, x0, fwhm):
+    u = (x - x0[:, None]) / fwhm[:, None]
+    gauss = np.exp(-FOUR_LN2 * u**2)
+    lorentz = 1. / (1. + 4. * u**2)
+    return u, gauss, lorentz
+
+
+def pk_model(p, x, pktype):
+    """Evaluate the peak model for each patch"""
+    u, gauss, lorentz = _profiles(x, p[:, 1], p[:, 2])
+    if pktype == 'gaussian':
+        profile = gauss
+    else:
+        n = p[:, 3, None]
+        profile = n * lorentz + (1. - n) * gauss
+
+    c0, c1 = p[:, -2, None], p[:, -1, None]
+    return p[:, 0, None] * profile + c0 + c1 * x
+
+
+def pk_jacobian(p, x, pktype):
+    """The (npatches, npts, nparams) Jacobian of pk_model"""
+    u, gauss, lorentz = _profiles(x, p[:, 1], p[:, 2])
+    amp = p[:, 0, None]
+    fwhm = p[:, 2, None]
+
+    # Derivatives of the profiles with respect to x0 and the FWHM
+    dgauss_dx0 = gauss * 2. * FOUR_LN2 * u / fwhm
+    dgauss_dw = dgauss_dx0 * u
+    dlorentz_dx0 = lorentz**2 * 8. * u / fwhm
+    dlorentz_dw = dlorentz_dx0 * u
+
+    jac = np.empty(x.shape + (NUM_PARAMS[pktype],))
+    if pktype == 'gaussian':
+        jac[..., 0] = gauss
+        jac[..., 1] = amp * dgauss_dx0
+        jac[..., 2] = amp * dgauss_dw
+    else:
+        n = p[:, 3, None]
+        jac[..., 0] = n * lorentz + (1. - n) * gauss
+        jac[..., 1] = amp * (n * dlorentz_dx0 + (1. - n) * dgauss_dx0)
+        jac[..., 2] = amp * (n * dlorentz_dw + (1. - n) * dgauss_dw)
+        jac[..., 3] = amp * (lorentz - gauss)
+
+    jac[..., -2] = 1.
+    jac[..., -1] = x
+    return jac
+
+
+def estimate_pk_parms(x, y, pktype):
+    """Closed-form initial estimates for each patch
+
+    The background is the line through the end points, the peak is at
+    the maximum above the background, and the FWHM is the width of the
+    points above half of that maximum.
+    """
+    npatches = len(x)
+    rows = np.arange(npatches)
+
+    c1 = (y[:, -1] - y[:, 0]) / (x[:, -1] - x[:, 0])
+    c0 = y[:, 0] - c1 * x[:, 0]
+    y_nobg = y - (c0[:, None] + c1[:, None] * x)
+
+    imax = np.argmax(y_nobg, axis=1)
+    amp = y_nobg[rows, imax]
+    x0 = x[rows, imax]
+
+    dx = np.abs(np.diff(x, axis=1)).mean(axis=1)
+    above = y_nobg >= 0.5 * amp[:, None]
+    fwhm = np.maximum(np.count_nonzero(above, axis=1), 1) * dx
+
+    p0 = np.empty((npatches, NUM_PARAMS[pktype]))
+    p0[:, 0] = amp
+    p0[:, 1] = x0
+    p0[:, 2] = fwhm
+    if pktype == 'pvoigt':
+        p0[:, 3] = 0.5
+    p0[:, -2] = c0
+    p0[:, -1] = c1
+    return p0
+
+
+def _constrain(p, pktype):
+    # Keep the FWHM positive and the Lorentzian fraction within [0, 1]
+    p[:, 2] = np.maximum(np.abs(p[:, 2]), 1e-12)
+    if pktype == 'pvoigt':
+        p[:, 3] = np.clip(p[:, 3], 0., 1.)
+    return p
+
+
+def fit_pk_parms(p0, x, y, pktype, max_iter=100, ftol=1e-10):
+    """Fit all patches with a stacked Levenberg-Marquardt
+
+    Every patch keeps its own damping factor and is updated
+    independently, but the steps of all patches are computed together.
+    """
+    p = _constrain(np.array(p0, dtype=float), pktype)
+    resd = y - pk_model(p, x, pktype)
+    cost = np.sum(resd**2, axis=1)
+    lam = np.full(len(p), 1e-3)
+    active = np.ones(len(p), dtype=bool)
+    eye = np.eye(p.shape[1])
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+
+        idx = np.flatnonzero(active)
+        jac = pk_jacobian(p[idx], x[idx], pktype)
+        jtj = np.einsum('nmi,nmj->nij', jac, jac)
+        jtr = np.einsum('nmi,nm->ni', jac, resd[idx])
+
+        diag = np.einsum('nii->ni', jtj)
+        damped = jtj + lam[idx, None, None] * diag[:, :, None] * eye
+        try:
+            step = np.linalg.solve(damped, jtr[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            # At least one of the systems is singular
+            step = (np.linalg.pinv(damped) @ jtr[..., None])[..., 0]
+
+        p_new = _constrain(p[idx] + step, pktype)
+        resd_new = y[idx] - pk_model(p_new, x[idx], pktype)
+        cost_new = np.sum(resd_new**2, axis=1)
+
+        better = cost_new < cost[idx]
+        accepted = idx[better]
+        converged = (cost[accepted] - cost_new[better] <=
+                     ftol * np.maximum(cost[accepted], 1e-300))
+
+        p[accepted] = p_new[better]
+        resd[accepted] = resd_new[better]
+        cost[accepted] = cost_new[better]
+        lam[accepted] /= 10.
+        lam[idx[~better]] *= 10.
+
+        # Stop patches that converged or can no longer make progress
+        active[accepted[converged]] = False
+        active[idx[~better][lam[idx[~better]] > 1e10]] = False
+
+    return p
+
+
+def fit_patches(x, y, pktype):
+    """Estimate and fit the peaks of a stack of patches"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return fit_pk_parms(estimate_pk_parms(x, y, pktype), x, y, pktype)
@@ -1,12 +1,15 @@
+import copy
 import warnings
 
 import numpy as np
 
-from hexrd import instrument
 from hexrd.gridutil import cellIndices
 
+from hexrd.ui.calibration.warp_executor import map_warps
 from hexrd.ui.hexrd_config import HexrdConfig
-from hexrd.ui.utils import select_merged_rings
+from hexrd.ui.utils import panel_geometry_key, select_merged_rings
+
+from scipy import ndimage
 
 from skimage import transform as tf
 from skimage.exposure import equalize_adapthist
@@ -14,18 +17,17 @@ from skimage.exposure import rescale_intensity
 
 from .display_plane import DisplayPlane
 
+# Warp maps are cached per detector name, and rebuilt whenever the
+# geometry key of that detector no longer matches.
+_warp_map_cache = {}
+
 
-def cartesian_viewer():
+def cartesian_viewer(cancel_token=None):
     images_dict = HexrdConfig().current_images_dict()
     plane_data = HexrdConfig().active_material.planeData
     pixel_size = HexrdConfig().cartesian_pixel_size
 
-    # HEDMInstrument expects None Euler angle convention for the
-    # config. Let's get it as such.
-    iconfig = HexrdConfig().instrument_config_none_euler_convention
-    rme = HexrdConfig().rotation_matrix_euler()
-    instr = instrument.HEDMInstrument(instrument_config=iconfig,
-                                      tilt_calibration_mapping=rme)
+    instr = HexrdConfig().instrument_snapshot()
 
     # Make sure each key in the image dict is in the panel_ids
     if images_dict.keys() != instr._detectors.keys():
@@ -34,13 +36,49 @@ def cartesian_viewer():
                'PanelIds: ' + str(list(instr._detectors.keys())))
         raise Exception(msg)
 
-    return InstrumentViewer(instr, images_dict, plane_data, pixel_size)
+    return InstrumentViewer(instr, images_dict, plane_data, pixel_size,
+                            cancel_token)
+
+
+def warp_panel(warp_map, img):
+    """Warp a single panel image into its footprint in the display plane
+
+    This is a module-level function so that it may be sent to a
+    process pool.
+    """
+    return warp_map.warp(img)
+
+
+class CartesianWarpMap:
+    """Precomputed inverse coordinate map from the display plane to a panel
+
+    For every display pixel inside of the footprint of the panel, this
+    stores the (row, col) coordinates on the panel to sample from.
+    Warping a frame is then only a bilinear remap over the footprint.
+    """
+
+    def __init__(self, tform, bbox, key):
+        self.key = key
+        self.bbox = bbox
+
+        rows, cols = np.mgrid[bbox]
+        coords = tform(np.vstack((cols.ravel(), rows.ravel())).T)
+        self.coords = np.array([coords[:, 1].reshape(rows.shape),
+                                coords[:, 0].reshape(rows.shape)],
+                               dtype=np.float32)
+
+    def warp(self, img):
+        """Warp an image over the footprint only"""
+        return ndimage.map_coordinates(img, self.coords, output=np.float32,
+                                       order=1, mode='constant', cval=0.)
 
 
 class InstrumentViewer:
 
-    def __init__(self, instr, images_dict, plane_data, pixel_size):
+    def __init__(self, instr, images_dict, plane_data, pixel_size,
+                 cancel_token=None):
         self.type = 'cartesian'
+        self.cancel_token = cancel_token
         self.instr = instr
         self.images_dict = images_dict
         self.plane_data = plane_data
@@ -59,6 +97,10 @@ class InstrumentViewer:
         self.make_dpanel()
         self.plot_dplane()
 
+    def check_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
     def make_dpanel(self):
         self.dpanel_sizes = self.dplane.panel_size(self.instr)
         self.dpanel = self.dplane.display_panel(self.dpanel_sizes,
@@ -122,16 +164,27 @@ class InstrumentViewer:
         self.min = min([x.min() for x in images])
         self.max = max([x.max() for x in images])
 
-        # Create the warped image for each detector
-        for detector_id in self.images_dict.keys():
-            self.create_warped_image(detector_id)
+        # Create the warped image for each detector. These may run in
+        # parallel, depending on the warp executor settings.
+        detectors = list(self.images_dict.keys())
+        jobs = []
+        for detector_id in detectors:
+            self.check_cancelled()
+            jobs.append(self.warp_job(detector_id))
+
+        self.check_cancelled()
+        results = map_warps(warp_panel, jobs)
+        for detector_id, job, warp in zip(detectors, jobs, results):
+            # Keep the footprint of the panel along with the warp
+            self.warp_dict[detector_id] = (job[0].bbox, warp)
 
         # Generate the final image
+        self.check_cancelled()
         self.generate_image()
 
-    def create_warped_image(self, detector_id):
+    def warp_job(self, detector_id):
+        """Get the arguments to warp_panel() for a detector"""
         img = self.images_dict[detector_id]
-        panel = self.instr._detectors[detector_id]
 
         if HexrdConfig().show_detector_borders:
             # Draw a border around the detector panel
@@ -143,6 +196,27 @@ class InstrumentViewer:
             img[:pbuf, :] = max_int
             img[-pbuf:, :] = max_int
 
+        return (self.warp_map(detector_id), img)
+
+    def warp_map(self, detector_id):
+        """Get the cached warp map for a detector
+
+        The map is only recomputed if the panel geometry, the display
+        plane, or the pixel size changed.
+        """
+        panel = self.instr._detectors[detector_id]
+        shape = (self.dpanel.rows, self.dpanel.cols)
+        key = panel_geometry_key(panel, self.instr.tvec) + (
+            tuple(np.ravel(self.dplane.tvec)),
+            tuple(np.ravel(self.dplane.tilt)),
+            self.pixel_size,
+            shape,
+        )
+
+        warp_map = _warp_map_cache.get(detector_id)
+        if warp_map is not None and warp_map.key == key:
+            return warp_map
+
         # map corners
         corners = np.vstack(
             [panel.corner_ll,
@@ -166,32 +240,58 @@ class InstrumentViewer:
         tform3 = tf.ProjectiveTransform()
         tform3.estimate(src, dst)
 
-        res = tf.warp(img, tform3,
-                      output_shape=(self.dpanel.rows, self.dpanel.cols))
-        self.warp_dict[detector_id] = res
+        bbox = self.dplane.panel_footprint(self.dpanel, i_row, j_col)
+
+        warp_map = CartesianWarpMap(tform3, bbox, key)
+        _warp_map_cache[detector_id] = warp_map
+        return warp_map
+
+    def create_warped_image(self, detector_id):
+        warp_map, img = self.warp_job(detector_id)
+        res = warp_panel(warp_map, img)
+        self.warp_dict[detector_id] = (warp_map.bbox, res)
         return res
 
     def generate_image(self):
-        img = np.zeros((self.dpanel.rows, self.dpanel.cols))
+        # Accumulate the footprint of every panel into a single canvas
+        img = np.zeros((self.dpanel.rows, self.dpanel.cols),
+                       dtype=np.float32)
         for key in self.images_dict.keys():
-            img += self.warp_dict[key]
+            bbox, warp = self.warp_dict[key]
+            img[bbox] += warp
 
         # Rescale the data to match the scale of the original dataset
         # TODO: try to get create_calibration_image to not rescale the
         # result to be between 0 and 1 in the first place so this will
         # not be necessary.
-        self.img = np.interp(img, (img.min(), img.max()), (self.min, self.max))
-
-    def update_detector(self, det):
-        # First, convert to the "None" angle convention
-        iconfig = HexrdConfig().instrument_config_none_euler_convention
-
-        t_conf = iconfig['detectors'][det]['transform']
-        self.instr.detectors[det].tvec = t_conf['translation']
-        self.instr.detectors[det].tilt = t_conf['tilt']
-
-        # Update the individual detector image
-        self.create_warped_image(det)
+        img_min, img_max = img.min(), img.max()
+        if img_max > img_min:
+            img -= img_min
+            img *= (self.max - self.min) / (img_max - img_min)
+            img += self.min
+        else:
+            img.fill(self.min)
+        self.img = img
+
+    def updated(self, detectors, cancel_token=None):
+        """A copy of the viewer with the transforms of detectors updated
+
+        This viewer is not modified, so the update may run in the
+        background while it is still being displayed.
+        """
+        viewer = copy.copy(self)
+        viewer.cancel_token = cancel_token
+        viewer.warp_dict = self.warp_dict.copy()
+
+        # Take a new snapshot with the modified transforms
+        viewer.instr = HexrdConfig().instrument_snapshot()
+
+        # Update the individual detector images
+        for det in detectors:
+            viewer.check_cancelled()
+            viewer.create_warped_image(det)
 
         # Generate the final image
-        self.generate_image()
+        viewer.check_cancelled()
+        viewer.generate_image()
+        return viewer
@@ -57,3 +57,19 @@ class DisplayPlane:
             tvec=self.tvec, tilt=self.tilt)
 
         return display_panel
+
+    def panel_footprint(self, dpanel, rows, cols):
+        """return bounding box of a panel in the display panel
+
+        rows and cols are the display panel pixel indices of the mapped
+        panel corners. The panel is a quadrilateral in the display
+        plane, so the mapped corners bound it. The box is padded by a
+        pixel to include the interpolated edges.
+        """
+        i_min = max(int(np.floor(np.nanmin(rows))) - 1, 0)
+        i_max = min(int(np.ceil(np.nanmax(rows))) + 2, dpanel.rows)
+        j_min = max(int(np.floor(np.nanmin(cols))) - 1, 0)
+        j_max = min(int(np.ceil(np.nanmax(cols))) + 2, dpanel.cols)
+
+        return (slice(i_min, max(i_max, i_min)),
+                slice(j_min, max(j_max, j_min)))
@@ -0,0 +1,282 @@
+import os
+
+import h5py
+import numpy as np
+
+from scipy import sparse
+
+from hexrd.ui import constants
+from hexrd.ui.calibration.polarview import PolarView, azimuthal_weights
+from hexrd.ui.hexrd_config import HexrdConfig
+from hexrd.ui.utils import panel_geometry_key
+
+HDF5_EXTENSIONS = ('.h5', '.hdf5')
+
+
+def is_hdf5_file(filename):
+    return os.path.splitext(filename)[1].lower() in HDF5_EXTENSIONS
+
+
+def imageseries_length(ims_dict):
+    """Get the number of frames shared by all of the imageseries"""
+    lengths = {len(ims) for ims in ims_dict.values()}
+    if len(lengths) != 1:
+        msg = ('Imageseries lengths do not match: ' +
+               str({k: len(v) for k, v in ims_dict.items()}))
+        raise Exception(msg)
+
+    return lengths.pop()
+
+
+def imageseries_omegas(ims_dict):
+    """Get the (nframes, 2) omega ranges of the imageseries, if present"""
+    for ims in ims_dict.values():
+        if 'omega' in ims.metadata:
+            return np.asarray(ims.metadata['omega'])
+
+    return None
+
+
+def read_frames(ims_dict, detectors, frames):
+    """Read the given frames of each imageseries into (n, rows, cols) stacks
+
+    The frames are read through the frame cache, so that the reads are
+    serialized with the other reads of the same imageseries.
+    """
+    frame_cache = HexrdConfig().frame_cache
+    return {det: np.array([frame_cache.read(det, ims_dict[det], i)
+                           for i in frames])
+            for det in detectors}
+
+
+def polar_frames(pv, ims_dict, frames, chunk_size=None):
+    """Warp frames of the imageseries into polar images, chunk by chunk
+
+    Yields (start, stack) pairs, where stack has the shape
+    (n, neta, ntth) and holds the polar images of frames
+    frames[start:start + n]. Each chunk is warped with a single sparse
+    product for the whole instrument.
+    """
+    if chunk_size is None:
+        chunk_size = constants.POLAR_BATCH_CHUNK_SIZE
+
+    detectors = list(ims_dict.keys())
+    for start in range(0, len(frames), chunk_size):
+        chunk = frames[start:start + chunk_size]
+        yield start, pv.warp_stacked(read_frames(ims_dict, detectors, chunk))
+
+
+def write_polar_stack(filename, frames=None, chunk_size=None,
+                      progress_callback=None):
+    """Write the polar images of whole imageseries to a file
+
+    The (nframes, neta, ntth) stack is streamed to a chunked HDF5 file
+    if filename has an HDF5 extension, and to a memory-mapped .npy file
+    otherwise. The tth and eta coordinates (in radians) and the omega
+    ranges (if available) of the frames are attached: as datasets in
+    the HDF5 file, or in a "<name>_meta.npz" file next to the .npy file.
+
+    The intensities are the raw warped intensities, without the
+    rescaling and snip1d background removal of the polar view.
+    """
+    ims_dict = HexrdConfig().imageseries_dict
+    if not ims_dict:
+        raise Exception('No imageseries available for the polar transform')
+
+    nframes = imageseries_length(ims_dict)
+    if frames is None:
+        frames = np.arange(nframes)
+    frames = np.asarray(frames)
+
+    instr = HexrdConfig().instrument_snapshot()
+    pv = PolarView(instr, eta_min=-180., eta_max=180.)
+    shape = (len(frames),) + pv.shape
+
+    eta, tth = pv.angular_grid
+    meta = {
+        'frames': frames,
+        'tth_coordinates': tth[0],
+        'eta_coordinates': eta[:, 0],
+    }
+    omegas = imageseries_omegas(ims_dict)
+    if omegas is not None:
+        meta['omega'] = omegas[frames]
+
+    if is_hdf5_file(filename):
+        f = h5py.File(filename, 'w')
+        chunks = (1,) + pv.shape
+        out = f.create_dataset('intensities', shape, dtype=np.float32,
+                               chunks=chunks)
+        for k, v in meta.items():
+            f.create_dataset(k, data=v)
+    else:
+        f = None
+        out = np.lib.format.open_memmap(filename, mode='w+',
+                                        dtype=np.float32, shape=shape)
+        meta_file = os.path.splitext(filename)[0] + '_meta.npz'
+        np.savez(meta_file, **meta)
+
+    try:
+        for start, stack in polar_frames(pv, ims_dict, frames, chunk_size):
+            out[start:start + len(stack)] = stack
+            if progress_callback is not None:
+                done = start + len(stack)
+                progress_callback.emit(int(done / len(frames) * 100))
+    finally:
+        if f is not None:
+            f.close()
+        else:
+            out.flush()
+            del out
+
+    return filename
+
+
+class AzimuthalIntegrator:
+    """Stream frames of the imageseries into azimuthal lineouts
+
+    The polar warp and the weighted mean over eta (see
+    polarview.azimuthal_weights) are combined into a single
+    (ntth, npixels) sparse matrix, so that each frame is reduced to its
+    lineout directly and memory stays bounded by one chunk of frames.
+    Calling update() again only integrates frames that were added to
+    the imageseries since the last call. If the imageseries, the
+    instrument geometry, or the polar grid have changed in the
+    meantime, all of the frames are integrated again.
+
+    Nothing is computed until the first update(), so that it may be
+    created on the GUI thread and updated in the background.
+    """
+
+    def __init__(self, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = constants.POLAR_BATCH_CHUNK_SIZE
+
+        self.chunk_size = chunk_size
+
+        self.detectors = []
+        self._imageseries = []
+        self._geometry_key = None
+        self.tth = None
+        self.matrix = None
+
+        self.nframes = 0
+        self._buffer = np.empty((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def polar_view():
+        instr = HexrdConfig().instrument_snapshot()
+        return PolarView(instr, eta_min=-180., eta_max=180.)
+
+    @staticmethod
+    def geometry_key(pv):
+        """Everything about the geometry that the lineouts depend upon"""
+        panels = tuple(panel_geometry_key(x, pv.tvec_s)
+                       for x in pv.detectors.values())
+        return panels + pv.polar_key
+
+    def reset(self, ims_dict, pv):
+        """Drop the lineouts, and set up the integration of ims_dict"""
+        self.detectors = list(ims_dict.keys())
+        self._imageseries = list(ims_dict.values())
+        self._geometry_key = self.geometry_key(pv)
+        self.tth = pv.angular_grid[1][0]
+
+        # Take the weighted mean over the covered bins of each tth column
+        ntth = pv.ntth
+        bins = np.arange(pv.neta * ntth)
+        tables = [pv.lookup_table(x) for x in self.detectors]
+        weights = azimuthal_weights(tables).ravel()
+        eta_sum = sparse.csr_matrix(
+            (weights, (bins % ntth, bins)),
+            shape=(ntth, len(bins)))
+        self.matrix = (eta_sum @ pv.stacked_matrix(self.detectors)).tocsr()
+
+        self.nframes = 0
+        self._buffer = np.empty((0, ntth), dtype=np.float32)
+
+    def is_stale(self, ims_dict, pv):
+        """Whether the lineouts were integrated from other sources"""
+        if self.matrix is None:
+            return True
+
+        if list(ims_dict.keys()) != self.detectors:
+            return True
+
+        if any(x is not y for x, y in zip(ims_dict.values(),
+                                          self._imageseries)):
+            return True
+
+        return self.geometry_key(pv) != self._geometry_key
+
+    @property
+    def lineouts(self):
+        """The (nframes, ntth) lineouts integrated so far"""
+        return self._buffer[:self.nframes]
+
+    @property
+    def omegas(self):
+        omegas = imageseries_omegas(HexrdConfig().imageseries_dict)
+        if omegas is None or len(omegas) < self.nframes:
+            return None
+
+        return omegas[:self.nframes]
+
+    def integrate(self, stacks):
+        """Reduce (n, rows, cols) stacks of frames to (n, ntth) lineouts"""
+        n = len(stacks[self.detectors[0]])
+        vecs = np.hstack([stacks[x].reshape(n, -1) for x in self.detectors])
+        return (self.matrix @ vecs.T).T
+
+    def append(self, lineouts):
+        """Append lineouts, growing the buffer geometrically"""
+        end = self.nframes + len(lineouts)
+        if end > len(self._buffer):
+            size = max(end, 2 * len(self._buffer))
+            buffer = np.empty((size, self._buffer.shape[1]),
+                              dtype=self._buffer.dtype)
+            buffer[:self.nframes] = self.lineouts
+            self._buffer = buffer
+
+        self._buffer[self.nframes:end] = lineouts
+        self.nframes = end
+
+    def update(self, progress_callback=None):
+        """Integrate all frames that have not been integrated yet"""
+        ims_dict = HexrdConfig().imageseries_dict
+        pv = self.polar_view()
+        total = imageseries_length(ims_dict)
+        if self.is_stale(ims_dict, pv) or total < self.nframes:
+            # The imageseries, the instrument or the polar grid changed.
+            # Start over.
+            self.reset(ims_dict, pv)
+
+        frames = np.arange(self.nframes, total)
+        for start in range(0, len(frames), self.chunk_size):
+            chunk = frames[start:start + self.chunk_size]
+            stacks = read_frames(ims_dict, self.detectors, chunk)
+            self.append(self.integrate(stacks))
+
+            if progress_callback is not None:
+                done = start + len(chunk)
+                progress_callback.emit(int(done / len(frames) * 100))
+
+        return self.lineouts
+
+    def write(self, filename):
+        """Write the lineouts to an HDF5 or an NPZ file"""
+        data = {
+            'lineouts': self.lineouts,
+            'tth_coordinates': self.tth,
+            'frames': np.arange(self.nframes),
+        }
+        omegas = self.omegas
+        if omegas is not None:
+            data['omega'] = omegas
+
+        if is_hdf5_file(filename):
+            with h5py.File(filename, 'w') as f:
+                for k, v in data.items():
+                    f.create_dataset(k, data=v)
+        else:
+            np.savez(filename, **data)
@@ -1,6 +1,7 @@
+import copy
+
 import numpy as np
 
-from hexrd import instrument
 from .polarview import PolarView
 
 from .display_plane import DisplayPlane
@@ -9,28 +10,24 @@ from hexrd.ui.hexrd_config import HexrdConfig
 from hexrd.ui.utils import select_merged_rings
 
 
-def polar_viewer():
+def polar_viewer(resolution_factor=1, cancel_token=None):
     images_dict = HexrdConfig().current_images_dict()
     plane_data = HexrdConfig().active_material.planeData
 
-    # HEDMInstrument expects None Euler angle convention for the
-    # config. Let's get it as such.
-    iconfig = HexrdConfig().instrument_config_none_euler_convention
-    return InstrumentViewer(iconfig, images_dict, plane_data)
-
-
-def load_instrument(config):
-    rme = HexrdConfig().rotation_matrix_euler()
-    return instrument.HEDMInstrument(instrument_config=config,
-                                     tilt_calibration_mapping=rme)
+    instr = HexrdConfig().instrument_snapshot()
+    return InstrumentViewer(instr, images_dict, plane_data,
+                            resolution_factor, cancel_token)
 
 
 class InstrumentViewer:
 
-    def __init__(self, config, images_dict, plane_data):
+    def __init__(self, instr, images_dict, plane_data, resolution_factor=1,
+                 cancel_token=None):
         self.type = 'polar'
+        self.resolution_factor = resolution_factor
+        self.cancel_token = cancel_token
         self.plane_data = plane_data
-        self.instr = load_instrument(config)
+        self.instr = instr
         self.images_dict = images_dict
         self.dplane = DisplayPlane()
 
@@ -42,8 +39,13 @@ class InstrumentViewer:
         self._make_dpanel()
 
         self.draw_polar()
+        self.check_cancelled()
         self.add_rings()
 
+    def check_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
     def _make_dpanel(self):
         self.dpanel_sizes = self.dplane.panel_size(self.instr)
         self.dpanel = self.dplane.display_panel(self.dpanel_sizes,
@@ -55,8 +57,9 @@ class InstrumentViewer:
 
     def draw_polar(self):
         """show polar view of rings"""
-        self.pv = PolarView(self.instr, eta_min=-180., eta_max=180.)
-        self.pv.warp_all_images()
+        self.pv = PolarView(self.instr, eta_min=-180., eta_max=180.,
+                            resolution_factor=self.resolution_factor)
+        self.pv.warp_all_images(self.cancel_token)
 
         tth_min = HexrdConfig().polar_res_tth_min
         tth_max = HexrdConfig().polar_res_tth_max
@@ -113,9 +116,29 @@ class InstrumentViewer:
 
         return self.ring_data
 
-    def update_detector(self, det):
-        self.pv.update_detector(det)
-        self.img = self.pv.img
+    @property
+    def azimuthal_integral(self):
+        return self.pv.azimuthal_integral(self.img)
+
+    def updated(self, detectors, cancel_token=None):
+        """A copy of the viewer with the transforms of detectors updated
+
+        This viewer is not modified, so the update may run in the
+        background while it is still being displayed.
+        """
+        viewer = copy.copy(self)
+        viewer.cancel_token = cancel_token
+        viewer.pv = self.pv.copy()
+
+        # Take a single snapshot with the modified transforms
+        instr = HexrdConfig().instrument_snapshot()
+        for det in detectors:
+            viewer.check_cancelled()
+            viewer.pv.update_detector(det, instr)
+
+        viewer.instr = viewer.pv.instr
+        viewer.img = viewer.pv.img
+        return viewer
 
     def write_image(self, filename='polar_image.npz'):
         np.savez(filename,
@@ -1,5 +1,9 @@
+import copy
+
 import numpy as np
 
+from scipy import sparse
+
 from skimage.exposure import rescale_intensity
 
 from hexrd.transforms.xfcapi import \
@@ -7,12 +11,27 @@ from hexrd.transforms.xfcapi import \
      gvecToDetectorXY
 
 from hexrd import constants as cnst
+from hexrd.gridutil import cellIndices
 
+from hexrd.ui.calibration.warp_executor import map_warps
 from hexrd.ui.hexrd_config import HexrdConfig
-from hexrd.ui.utils import run_snip1d, snip_width_pixels
+from hexrd.ui.utils import (
+    panel_geometry_key, run_snip1d, snip_width_pixels
+)
 
 tvec_c = cnst.zeros_3
 
+# Lookup tables are cached per detector name and resolution factor, and
+# rebuilt whenever the geometry key of that detector no longer matches.
+_lookup_table_cache = {}
+
+# The stacked sparse matrix for the whole instrument, stored along with
+# the keys of the lookup tables it was built from as a single entry.
+_stacked_matrix_cache = {}
+
+# The azimuthal integration weights, keyed the same way
+_azimuthal_weights_cache = {}
+
 
 def sqrt_scale_img(img):
     fimg = np.array(img, dtype=float)
@@ -26,10 +45,169 @@ def log_scale_img(img):
     return np.log(fimg)
 
 
+class PolarLookupTable(object):
+    """Precomputed bilinear interpolation from a panel to polar bins
+
+    This stores, for every polar bin that lands on the panel, the flat
+    indices of the four surrounding detector pixels and their bilinear
+    weights. Warping a frame is then only a gather and a multiply.
+    """
+    def __init__(self, panel, xypts, shape, key=None):
+        self.key = key
+        self.shape = shape
+        self.panel_shape = (panel.rows, panel.cols)
+
+        # clip away points too close to or off the edges of the detector
+        xy_clip, on_panel = panel.clip_to_panel(xypts, buffer_edges=True)
+        self.bin_indices = np.flatnonzero(on_panel)
+
+        # grab fractional pixel indices of clipped points
+        ij_frac = panel.cartToPixel(xy_clip)
+
+        # get floors/ceils from array of pixel _centers_
+        i_floor = cellIndices(panel.row_pixel_vec, xy_clip[:, 1])
+        j_floor = cellIndices(panel.col_pixel_vec, xy_clip[:, 0])
+        i_ceil = i_floor + 1
+        j_ceil = j_floor + 1
+
+        wi_floor = i_ceil - ij_frac[:, 0]
+        wi_ceil = ij_frac[:, 0] - i_floor
+        wj_floor = j_ceil - ij_frac[:, 1]
+        wj_ceil = ij_frac[:, 1] - j_floor
+
+        cols = panel.cols
+        self.pixel_indices = np.vstack([
+            i_floor * cols + j_floor,
+            i_floor * cols + j_ceil,
+            i_ceil * cols + j_floor,
+            i_ceil * cols + j_ceil,
+        ])
+        self.weights = np.vstack([
+            wi_floor * wj_floor,
+            wi_floor * wj_ceil,
+            wi_ceil * wj_floor,
+            wi_ceil * wj_ceil,
+        ])
+
+        # The bounding box of the panel in (eta, tth)
+        self.bbox = None
+        if self.bin_indices.size:
+            rows, cols = np.unravel_index(self.bin_indices, self.shape)
+            self.bbox = (slice(rows.min(), rows.max() + 1),
+                         slice(cols.min(), cols.max() + 1))
+
+    def warp(self, img):
+        assert img.shape == self.panel_shape, \
+            "input image must be 2-d with shape (%d, %d)" % self.panel_shape
+
+        vals = np.sum(
+            np.ravel(img)[self.pixel_indices] * self.weights, axis=0)
+
+        ret = np.zeros(np.prod(self.shape))
+        ret[self.bin_indices] = vals
+        return ret.reshape(self.shape)
+
+    @property
+    def sparse_matrix(self):
+        """A CSR matrix mapping raveled panel pixels to raveled polar bins
+        """
+        if not hasattr(self, '_sparse_matrix'):
+            nbins = int(np.prod(self.shape))
+            npixels = int(np.prod(self.panel_shape))
+            rows = np.tile(self.bin_indices, len(self.pixel_indices))
+            self._sparse_matrix = sparse.csr_matrix(
+                (self.weights.ravel(), (rows, self.pixel_indices.ravel())),
+                shape=(nbins, npixels))
+        return self._sparse_matrix
+
+    @property
+    def coverage(self):
+        """The number of times each raveled polar bin is covered (0 or 1)"""
+        coverage = np.zeros(np.prod(self.shape))
+        coverage[self.bin_indices] = 1
+        return coverage
+
+    def sparse_warp(self, img):
+        assert img.shape == self.panel_shape, \
+            "input image must be 2-d with shape (%d, %d)" % self.panel_shape
+
+        return (self.sparse_matrix @ np.ravel(img)).reshape(self.shape)
+
+
+def stacked_sparse_matrix(tables):
+    """Horizontally stack the sparse matrices of several lookup tables
+
+    The result maps the concatenation of the raveled panel images (in
+    the order of `tables`) to the raveled, summed polar image.
+    """
+    keys = tuple(x.key for x in tables)
+
+    # The keys and the matrix are stored and read back together, as one
+    # entry, since this is called from several threads.
+    entry = _stacked_matrix_cache.get('entry')
+    if entry is None or entry[0] != keys:
+        matrix = sparse.hstack([x.sparse_matrix for x in tables]).tocsr()
+        entry = (keys, matrix)
+        _stacked_matrix_cache['entry'] = entry
+
+    return entry[1]
+
+
+def azimuthal_weights(tables):
+    """Get the weights of the azimuthal integration over several panels
+
+    Each polar bin is weighted by the inverse of the number of panels
+    that cover it, divided by the number of covered bins in its tth
+    column. Summing a polar image times these weights over eta is then
+    the mean over the covered bins, so gaps between the panels do not
+    bias the lineout.
+    """
+    keys = tuple(x.key for x in tables)
+
+    # Stored as one entry, like the stacked matrix
+    entry = _azimuthal_weights_cache.get('entry')
+    if entry is None or entry[0] != keys:
+        coverage = sum(x.coverage for x in tables).reshape(tables[0].shape)
+        covered = coverage > 0
+        weights = np.zeros(coverage.shape)
+        weights[covered] = 1 / coverage[covered]
+        weights /= np.maximum(np.count_nonzero(covered, axis=0), 1)
+        entry = (keys, weights)
+        _azimuthal_weights_cache['entry'] = entry
+
+    return entry[1]
+
+
+def union_bbox(a, b):
+    """Get the bounding box of two (row, col) slice tuples
+
+    Either may be None, meaning an empty bounding box.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+
+    return tuple(slice(min(x.start, y.start), max(x.stop, y.stop))
+                 for x, y in zip(a, b))
+
+
+def warp_panel(table, img, engine='lookup'):
+    """Warp a single panel image with its lookup table
+
+    This is a module-level function so that it may be sent to a
+    process pool.
+    """
+    if engine == 'sparse':
+        return table.sparse_warp(img)
+    return table.warp(img)
+
+
 class PolarView(object):
     """Create (two-theta, eta) plot of detectors
     """
-    def __init__(self, instrument, eta_min=0., eta_max=360.):
+    def __init__(self, instrument, eta_min=0., eta_max=360.,
+                 resolution_factor=1):
 
         # etas
         self._eta_min = np.radians(eta_min)
@@ -37,10 +215,22 @@ class PolarView(object):
 
         self.instr = instrument
 
+        # Multiplies the configured pixel sizes. Values greater than one
+        # are used to render quick, coarse previews.
+        self.resolution_factor = resolution_factor
+
         self.images_dict = HexrdConfig().current_images_dict()
 
         self.warp_dict = {}
 
+        # The (eta, tth) bounding box of each warp, as a tuple of slices
+        self.warp_bboxes = {}
+
+        # The running sum of the warps, before rescaling and snip1d
+        self.raw_img = None
+        self.raw_range = None
+
+        self.img = None
         self.snip1d_background = None
 
     @property
@@ -65,7 +255,7 @@ class PolarView(object):
 
     @property
     def tth_pixel_size(self):
-        return HexrdConfig().polar_pixel_size_tth
+        return HexrdConfig().polar_pixel_size_tth * self.resolution_factor
 
     @property
     def eta_min(self):
@@ -81,7 +271,7 @@ class PolarView(object):
 
     @property
     def eta_pixel_size(self):
-        return HexrdConfig().polar_pixel_size_eta
+        return HexrdConfig().polar_pixel_size_eta * self.resolution_factor
 
     @property
     def ntth(self):
@@ -103,23 +293,34 @@ class PolarView(object):
             + self.eta_min + 0.5 * np.radians(self.eta_pixel_size)
         return np.meshgrid(eta_vec, tth_vec, indexing='ij')
 
-    def create_warp_image(self, det):
-        angpts = self.angular_grid
-        dummy_ome = np.zeros((self.ntth * self.neta))
+    @property
+    def polar_key(self):
+        return (self.tth_min, self.tth_max, self.tth_pixel_size,
+                self.eta_min, self.eta_max, self.eta_pixel_size)
+
+    def lookup_table(self, det):
+        """Get the cached lookup table for a detector
 
-        # lcount = 0
+        The table is only recomputed if the panel geometry, the polar
+        resolution, or the tth/eta ranges have changed.
+        """
         panel = self.detectors[det]
-        img = self.images_dict[det]
+        key = panel_geometry_key(panel, self.tvec_s) + self.polar_key
 
-        if HexrdConfig().show_detector_borders:
-            # Draw a border around the detector panel
-            max_int = np.percentile(img, 99.95)
-            # A large percentage such as 3% is needed for it to show up
-            pbuf = int(0.03 * np.mean(img.shape))
-            img[:, :pbuf] = max_int
-            img[:, -pbuf:] = max_int
-            img[:pbuf, :] = max_int
-            img[-pbuf:, :] = max_int
+        cache_key = (det, self.resolution_factor)
+        table = _lookup_table_cache.get(cache_key)
+        if table is not None and table.key == key:
+            return table
+
+        table = PolarLookupTable(panel, self.detector_xy(panel), self.shape,
+                                 key=key)
+        _lookup_table_cache[cache_key] = table
+        return table
+
+    def detector_xy(self, panel):
+        """Compute the cartesian panel coordinates of each polar bin"""
+        angpts = self.angular_grid
+        dummy_ome = np.zeros((self.ntth * self.neta))
 
         gpts = anglesToGVec(
             np.vstack([
@@ -137,24 +338,124 @@ class PolarView(object):
             dparams = panel.distortion[1]
             xypts = dfunc(xypts, dparams)
 
-        self.warp_dict[det] = panel.interpolate_bilinear(
-            xypts, img, pad_with_nans=False
-        ).reshape(self.shape)
+        return xypts
+
+    def warp_job(self, det):
+        """Get the arguments to warp_panel() for a detector"""
+        img = self.images_dict[det]
+
+        if HexrdConfig().show_detector_borders:
+            # Draw a border around the detector panel
+            max_int = np.percentile(img, 99.95)
+            # A large percentage such as 3% is needed for it to show up
+            pbuf = int(0.03 * np.mean(img.shape))
+            img[:, :pbuf] = max_int
+            img[:, -pbuf:] = max_int
+            img[:pbuf, :] = max_int
+            img[-pbuf:, :] = max_int
+
+        table = self.lookup_table(det)
+        self.warp_bboxes[det] = table.bbox
+
+        engine = HexrdConfig().polar_warp_engine
+        return (table, img, engine)
+
+    def create_warp_image(self, det):
+        self.warp_dict[det] = warp_panel(*self.warp_job(det))
         return self.warp_dict[det]
 
+    def stacked_matrix(self, detectors=None):
+        """Get the sparse matrix for the whole instrument
+
+        The columns are ordered like the concatenation of the raveled
+        images of `detectors` (defaults to the keys of the images dict).
+        """
+        if detectors is None:
+            detectors = list(self.images_dict.keys())
+
+        return stacked_sparse_matrix([self.lookup_table(x)
+                                      for x in detectors])
+
+    @property
+    def azimuthal_weights(self):
+        """The per-bin weights of the azimuthal integration
+
+        These only depend on the geometry, and are reused for every
+        frame.
+        """
+        detectors = list(self.images_dict.keys())
+        return azimuthal_weights([self.lookup_table(x) for x in detectors])
+
+    def azimuthal_integral(self, img=None):
+        """The mean over eta of the covered bins of each tth column"""
+        if img is None:
+            img = self.img
+
+        return np.sum(img * self.azimuthal_weights, axis=0)
+
+    def warp_stacked(self, images_dict):
+        """Warp and sum all images with a single sparse product
+
+        The values of `images_dict` may also be stacks of frames, with
+        the frame index as the first axis. The returned array then has
+        the shape (nframes, neta, ntth).
+        """
+        detectors = list(images_dict.keys())
+        matrix = self.stacked_matrix(detectors)
+
+        images = [np.asarray(images_dict[x]) for x in detectors]
+        if images[0].ndim == 2:
+            vec = np.hstack([np.ravel(x) for x in images])
+            return (matrix @ vec).reshape(self.shape)
+
+        nframes = len(images[0])
+        vecs = np.hstack([x.reshape(nframes, -1) for x in images])
+        return (matrix @ vecs.T).T.reshape((nframes,) + self.shape)
+
     def generate_image(self):
         img = np.zeros(self.shape)
         for key in self.images_dict.keys():
             img += self.warp_dict[key]
 
+        self.raw_img = img
+        self.update_image()
+
+    def update_image(self, region=None):
+        """Rescale the raw image and apply snip1d to produce self.img
+
+        If region is given, only that part of the raw image has changed.
+        As long as the intensity range of the raw image is unchanged,
+        only the eta rows within the region are then rescaled. snip1d
+        still runs over the whole image, as its offset and threshold
+        depend on the statistics of the whole image.
+        """
+        raw = self.raw_img
+        raw_range = (raw.min(), raw.max())
+        apply_snip1d = HexrdConfig().polar_apply_snip1d
+
+        full_update = (
+            region is None or
+            self.img is None or
+            raw_range != self.raw_range or
+            apply_snip1d or
+            self.snip1d_background is not None
+        )
+        self.raw_range = raw_range
+
+        if not full_update:
+            rows = region[0]
+            self.img[rows] = rescale_intensity(
+                raw[rows], in_range=raw_range, out_range=(self.min, self.max))
+            return
+
         # ??? do log scaling here
         # img = log_scale_img(log_scale_img(sqrt_scale_img(img)))
 
         # Rescale the data to match the scale of the original dataset
-        img = rescale_intensity(img, out_range=(self.min, self.max))
+        img = rescale_intensity(raw, out_range=(self.min, self.max))
 
-        if HexrdConfig().polar_apply_snip1d:
-            self.snip1d_background = run_snip1d(img)
+        if apply_snip1d:
+            self.snip1d_background = run_snip1d(img, self.tth_pixel_size)
             # Perform the background subtraction
             img -= self.snip1d_background
         else:
@@ -162,29 +463,64 @@ class PolarView(object):
 
         self.img = img
 
-    def warp_all_images(self):
+    def warp_all_images(self, cancel_token=None):
+        def check_cancelled():
+            if cancel_token is not None:
+                cancel_token.check()
+
         # Cache the image max and min for later use
         images = self.images_dict.values()
         self.min = min([x.min() for x in images])
         self.max = max([x.max() for x in images])
 
-        # Create the warped image for each detector
-        for det in self.images_dict.keys():
-            self.create_warp_image(det)
+        # Create the warped image for each detector. These may run in
+        # parallel, depending on the warp executor settings.
+        detectors = list(self.images_dict.keys())
+        jobs = []
+        for det in detectors:
+            check_cancelled()
+            jobs.append(self.warp_job(det))
+
+        check_cancelled()
+        for det, warp in zip(detectors, map_warps(warp_panel, jobs)):
+            self.warp_dict[det] = warp
 
         # Generate the final image
+        check_cancelled()
         self.generate_image()
 
-    def update_detector(self, det):
-        # First, convert to the "None" angle convention
-        iconfig = HexrdConfig().instrument_config_none_euler_convention
-
-        t_conf = iconfig['detectors'][det]['transform']
-        self.instr.detectors[det].tvec = t_conf['translation']
-        self.instr.detectors[det].tilt = t_conf['tilt']
+    def copy(self):
+        """A copy that may be updated without modifying this one
+
+        The images and the lookup tables are shared, as neither is
+        modified by an update.
+        """
+        pv = copy.copy(self)
+        pv.warp_dict = self.warp_dict.copy()
+        pv.warp_bboxes = self.warp_bboxes.copy()
+        for name in ('raw_img', 'img', 'snip1d_background'):
+            value = getattr(self, name)
+            if value is not None:
+                setattr(pv, name, value.copy())
+        return pv
+
+    def update_detector(self, det, instr):
+        """Rewarp det with its transform in instr, an instrument snapshot
+        """
+        self.instr = instr
+
+        old_warp = self.warp_dict[det]
+        old_bbox = self.warp_bboxes.get(det)
 
         # Update the individual detector image
         self.create_warp_image(det)
 
+        # Swap the old warp for the new one in the running sum, but only
+        # over the region either of them covers.
+        region = union_bbox(old_bbox, self.warp_bboxes[det])
+        if region is not None:
+            self.raw_img[region] += (self.warp_dict[det][region] -
+                                     old_warp[region])
+
         # Generate the final image
-        self.generate_image()
+        self.update_image(region)
@@ -1,12 +1,16 @@
+import copy
+
 import numpy as np
 
 from scipy.optimize import leastsq, least_squares
+from scipy.sparse import coo_matrix
 
-from hexrd import instrument
 from hexrd.matrixutil import findDuplicateVectors
-from hexrd.fitting import fitpeak
 from hexrd.rotations import RotMatEuler
 
+from hexrd.ui import utils
+from hexrd.ui.calibration import batch_fitting
+from hexrd.ui.calibration.warp_executor import map_jobs
 from hexrd.ui.hexrd_config import HexrdConfig
 
 
@@ -29,7 +33,7 @@ class InstrumentCalibrator(object):
     # METHODS
     # =========================================================================
 
-    def run_calibration(self, use_robust_optimization=False):
+    def run_calibration(self, use_robust_optimization=False, progress=None):
         """
         FIXME: only coding serial powder case to get things going.  Will
         eventually figure out how to loop over multiple calibrator classes.
@@ -40,7 +44,7 @@ class InstrumentCalibrator(object):
 
         obj_func = calib_class.residual
 
-        data_dict = calib_class._extract_powder_lines()
+        data_dict = calib_class._extract_powder_lines(progress)
 
         # grab reduced optimizaion parameter set
         x0 = self._instr.calibration_parameters[
@@ -49,10 +53,20 @@ class InstrumentCalibrator(object):
 
         resd0 = obj_func(x0, data_dict)
 
-        if use_robust_optimization:
+        # The parameters of a panel only affect the residual of that
+        # panel. If several panels have refinable parameters of their
+        # own, their finite differences can be taken together. That
+        # requires trf, so plain least squares otherwise keeps using
+        # MINPACK's Levenberg-Marquardt. Like it, the parameters are
+        # scaled by the norms of the Jacobian columns, as the tilts and
+        # the translations differ by orders of magnitude.
+        block_sparse = calib_class.num_refined_panels(data_dict) > 1
+        if use_robust_optimization or block_sparse:
+            loss = 'soft_l1' if use_robust_optimization else 'linear'
             oresult = least_squares(
                 obj_func, x0, args=(data_dict, ),
-                method='trf', loss='soft_l1'
+                jac_sparsity=calib_class.jac_sparsity(data_dict),
+                method='trf', loss=loss, x_scale='jac'
             )
             x1 = oresult['x']
         else:
@@ -73,6 +87,102 @@ class InstrumentCalibrator(object):
             print('no improvement in residual!!!')
 
 
+def parameter_indices(instr, shared=True):
+    """
+    returns a dict over detectors of the indices of the full calibration
+    parameters of instr that affect each panel
+
+    The calibration parameters of the instrument are its own parameters,
+    followed by those of each panel, in order. The size of each panel
+    block is taken from the panel, and the instrument parameters are
+    the remainder. They affect every panel, and are left out unless
+    shared is True.
+    """
+    panel_sizes = [len(panel.calibration_parameters)
+                   for panel in instr.detectors.values()]
+    num_instr = len(instr.calibration_parameters) - sum(panel_sizes)
+    if num_instr < 0:
+        msg = ('The calibration parameters of the panels do not match '
+               'those of the instrument')
+        raise Exception(msg)
+
+    instr_idx = np.arange(num_instr if shared else 0)
+    start = num_instr
+    indices = {}
+    for det_key, size in zip(instr.detectors, panel_sizes):
+        indices[det_key] = np.hstack(
+            [instr_idx, np.arange(start, start + size)]).astype(int)
+        start += size
+
+    return indices
+
+
+def jac_sparsity(instr, num_points):
+    """
+    returns the sparsity pattern of the Jacobian of the powder residual
+    with respect to the refinable parameters of instr
+
+    num_points is a dict over detectors of the number of measured
+    points. Each point contributes an x and a y residual.
+    """
+    flags = np.asarray(instr.calibration_flags, dtype=bool)
+
+    # The column of each refinable parameter in the reduced set
+    columns = np.cumsum(flags) - 1
+
+    rows = [np.empty(0, dtype=int)]
+    cols = [np.empty(0, dtype=int)]
+    nrows = 0
+    for det_key, idx in parameter_indices(instr).items():
+        nresd = 2 * num_points[det_key]
+        det_cols = columns[idx[flags[idx]]]
+        rows.append(np.repeat(np.arange(nrows, nrows + nresd),
+                              len(det_cols)))
+        cols.append(np.tile(det_cols, nresd))
+        nrows += nresd
+
+    rows = np.hstack(rows)
+    cols = np.hstack(cols)
+    shape = (nrows, np.count_nonzero(flags))
+    return coo_matrix((np.ones(len(rows), dtype=int), (rows, cols)),
+                      shape=shape).tocsr()
+
+
+def fit_ring_patches(ringset, tth0, tth_tol, pktype):
+    """
+    fit all azimuthal patches of a ring at once
+
+    returns the fitted tth and the reference eta of the patches whose
+    fits are kept. This is a module-level function so that it can be
+    sent to a process pool.
+    """
+    # Patches with the same number of tth bins are fit together
+    groups = {}
+    for angs, intensities in ringset:
+        tth_centers = np.average(
+            np.vstack([angs[0][:-1], angs[0][1:]]),
+            axis=0)
+        int1d = np.sum(np.array(intensities).squeeze(), axis=0)
+        group = groups.setdefault(len(tth_centers), ([], [], []))
+        group[0].append(tth_centers)
+        group[1].append(int1d)
+        group[2].append(angs[1])
+
+    tth_meas = [np.empty(0)]
+    eta_ref = [np.empty(0)]
+    for tth_centers, int1d, etas in groups.values():
+        p = batch_fitting.fit_patches(tth_centers, int1d, pktype)
+
+        # !!! this is where we can kick out bunk fits
+        center_err = np.abs(p[:, 1] - tth0)
+        keep = (p[:, 0] >= 0.1) & (center_err <= np.radians(tth_tol))
+
+        tth_meas.append(p[keep, 1])
+        eta_ref.append(np.asarray(etas, dtype=float)[keep])
+
+    return np.hstack(tth_meas), np.hstack(eta_ref)
+
+
 # %%
 class PowderCalibrator(object):
     def __init__(self, instr, plane_data, img_dict,
@@ -92,6 +202,10 @@ class PowderCalibrator(object):
         # ??? fitting only, or do alternative peak detection?
         self._pktype = pktype
 
+        # for the residual
+        self._stacked_data = None
+        self._calc_xy_cache = {}
+
     @property
     def instr(self):
         return self._instr
@@ -146,7 +260,7 @@ class PowderCalibrator(object):
                 npdiv=2, collapse_eta=False, collapse_tth=False,
                 do_interpolation=True)
 
-    def _extract_powder_lines(self):
+    def _extract_powder_lines(self, progress=None):
         """
         return the RHS for the instrument DOF and image dict
 
@@ -156,6 +270,8 @@ class PowderCalibrator(object):
             [index over azimuthal patch]
                 [xy_meas, tth_meas, tth_ref, eta_ref]
 
+        progress, if given, is called with the fraction of fitted rings.
+
         FIXME: can not yet handle tth ranges with multiple peaks!
         """
         # ideal tth
@@ -175,61 +291,86 @@ class PowderCalibrator(object):
 
         powder_lines = self._interpolate_images()
 
-        # GRAND LOOP OVER PATCHES
-        rhs = dict.fromkeys(self.instr.detectors)
-        for det_key, panel in self.instr.detectors.items():
-            rhs[det_key] = []
+        # Fit the rings of all detectors in parallel
+        jobs = []
+        keys = []
+        for det_key in self.instr.detectors:
             for i_ring, ringset in enumerate(powder_lines[det_key]):
-                tmp = []
-                for angs, intensities in ringset:
-                    tth_centers = np.average(
-                        np.vstack([angs[0][:-1], angs[0][1:]]),
-                        axis=0)
-                    eta_ref = angs[1]
-                    int1d = np.sum(np.array(intensities).squeeze(), axis=0)
-                    """
-                    DARREN: FIT [tth_centers, intensities[0]] HERE
-
-                    RETURN TTH0
-                    rhs.append([tth0, eta_ref])
-                    """
-                    p0 = fitpeak.estimate_pk_parms_1d(
-                            tth_centers, int1d, self.pktype
-                         )
-
-                    p = fitpeak.fit_pk_parms_1d(
-                            p0, tth_centers, int1d, self.pktype
-                        )
-                    # !!! this is where we can kick out bunk fits
-                    tth_meas = p[1]
-                    center_err = abs(tth_meas - tth0[i_ring])
-                    if p[0] < 0.1 or center_err > np.radians(self.tth_tol):
-                        continue
-                    xy_meas = panel.angles_to_cart([[tth_meas, eta_ref], ])
-
-                    # FIXME: distortion kludge
-                    if panel.distortion is not None:
-                        xy_meas = panel.distortion[0](
-                                xy_meas,
-                                panel.distortion[1],
-                                invert=True
-                            )
-                    # cat results
-                    tmp.append(
-                        np.hstack(
-                            [xy_meas.squeeze(),
-                             tth_meas,
-                             tth0[i_ring],
-                             eta_ref]
-                        )
-                    )
-                    pass
-                rhs[det_key].append(np.vstack(tmp))
-                pass
-            rhs[det_key] = np.vstack(rhs[det_key])
-            pass
+                jobs.append((ringset, tth0[i_ring], self.tth_tol,
+                             self.pktype))
+                keys.append((det_key, i_ring))
+
+        results = map_jobs(fit_ring_patches, jobs, 'calibration',
+                           HexrdConfig().calibration_executor_type,
+                           HexrdConfig().calibration_workers, progress)
+
+        # The results are in the order of the jobs, so the rows of the
+        # RHS do not depend on the order in which the fits finish
+        rhs = {det_key: [] for det_key in self.instr.detectors}
+        for (det_key, i_ring), (tth_meas, eta_ref) in zip(keys, results):
+            panel = self.instr.detectors[det_key]
+            rhs[det_key].append(
+                self._ring_rhs(panel, tth_meas, eta_ref, tth0[i_ring]))
+
+        for det_key, rows in rhs.items():
+            rhs[det_key] = np.vstack(rows) if rows else np.empty((0, 5))
         return rhs
 
+    def _ring_rhs(self, panel, tth_meas, eta_ref, tth0):
+        """
+        returns the rows of [xy_meas, tth_meas, tth_ref, eta_ref] for the
+        fitted patches of a ring
+        """
+        if len(tth_meas) == 0:
+            return np.empty((0, 5))
+
+        xy_meas = panel.angles_to_cart(np.vstack([tth_meas, eta_ref]).T)
+
+        # FIXME: distortion kludge
+        if panel.distortion is not None:
+            xy_meas = panel.distortion[0](
+                    xy_meas,
+                    panel.distortion[1],
+                    invert=True
+                )
+
+        # cat results
+        return np.column_stack(
+            [xy_meas,
+             tth_meas,
+             np.full(len(tth_meas), tth0),
+             eta_ref]
+        )
+
+    def parameter_indices(self):
+        """
+        returns a dict over detectors of the indices of the full
+        calibration parameters that affect each panel
+        """
+        return parameter_indices(self.instr)
+
+    def jac_sparsity(self, data_dict):
+        """
+        returns the sparsity pattern of the Jacobian of the residual with
+        respect to the refinable parameters
+        """
+        num_points = {k: len(v) for k, v in data_dict.items()}
+        return jac_sparsity(self.instr, num_points)
+
+    def num_refined_panels(self, data_dict):
+        """
+        returns the number of panels with measured points and refinable
+        parameters of their own
+        """
+        flags = np.asarray(self.instr.calibration_flags, dtype=bool)
+        indices = parameter_indices(self.instr, shared=False)
+
+        count = 0
+        for det_key, idx in indices.items():
+            if len(data_dict[det_key]) and np.any(flags[idx]):
+                count += 1
+        return count
+
     def residual(self, reduced_params, data_dict):
         """
         """
@@ -240,36 +381,115 @@ class PowderCalibrator(object):
         self.instr.update_from_parameter_list(full_params)
 
         # build residual
+        data, param_indices = self._residual_data(data_dict)
         resd = []
         for det_key, panel in self.instr.detectors.items():
-            pdata = np.vstack(data_dict[det_key])
-            if len(pdata) > 0:
-                calc_xy = panel.angles_to_cart(pdata[:, -2:])
-
-                # FIXME: distortion kludge
-                if panel.distortion is not None:
-                    calc_xy = panel.distortion[0](
-                            calc_xy,
-                            panel.distortion[1],
-                            invert=True
-                        )
-
-                resd.append(
-                    (pdata[:, :2].flatten() - calc_xy.flatten())
-                )
+            xy_meas, angs = data[det_key]
+            if len(angs) > 0:
+                # Only panels whose parameters changed are recomputed
+                panel_params = full_params[param_indices[det_key]]
+                calc_xy = self._calc_xy(det_key, panel, angs, panel_params)
+                resd.append(xy_meas - calc_xy)
             else:
                 continue
         return np.hstack(resd)
 
+    def _residual_data(self, data_dict):
+        """
+        returns the stacked measured xy and reference angles per panel,
+        along with the parameter indices of each panel
+
+        These are computed once per data_dict.
+        """
+        if self._stacked_data is None or \
+                self._stacked_data[0] is not data_dict:
+            data = {}
+            for det_key, rows in data_dict.items():
+                pdata = np.vstack(rows) if len(rows) else np.empty((0, 5))
+                data[det_key] = (
+                    pdata[:, :2].flatten(),
+                    np.ascontiguousarray(pdata[:, -2:])
+                )
+
+            self._stacked_data = (data_dict, data, self.parameter_indices())
+            self._calc_xy_cache.clear()
+
+        return self._stacked_data[1:]
 
-def run_powder_calibration():
-    # Set up the tilt calibration mapping
-    rme = HexrdConfig().rotation_matrix_euler()
+    def _calc_xy(self, det_key, panel, angs, panel_params):
+        """
+        returns the flattened calculated xy of a panel, reusing the last
+        result if the parameters of the panel have not changed
+        """
+        cached = self._calc_xy_cache.get(det_key)
+        if cached is not None and np.array_equal(cached[0], panel_params):
+            return cached[1]
+
+        calc_xy = panel.angles_to_cart(angs)
+
+        # FIXME: distortion kludge
+        if panel.distortion is not None:
+            calc_xy = panel.distortion[0](
+                    calc_xy,
+                    panel.distortion[1],
+                    invert=True
+                )
 
-    # Set up the instrument
+        calc_xy = calc_xy.flatten()
+        self._calc_xy_cache[det_key] = (panel_params, calc_xy)
+        return calc_xy
+
+
+def calibration_images_dict(num_frames, progress=None):
+    """
+    returns the images to calibrate against, for each detector
+
+    With more than one frame, these are the means of num_frames frames,
+    starting at the current frame. The frames are streamed, so only a
+    running sum per detector is kept in memory. The interpolation of the
+    ring patches is linear in the intensities, so the patches of the
+    mean are the means of the patches of the frames.
+
+    progress, if given, is called with the fraction of frames read.
+    """
+    if num_frames <= 1:
+        return HexrdConfig().current_images_dict()
+
+    start = HexrdConfig().current_imageseries_idx
+    ims_dict = HexrdConfig().imageseries_dict
+    frame_cache = HexrdConfig().frame_cache
+
+    # The frames are read without storing them in the frame cache, so
+    # that they do not evict the frames being viewed
+    stops = {k: min(start + num_frames, len(v)) for k, v in ims_dict.items()}
+    total = sum(stop - start for stop in stops.values())
+
+    ret = {}
+    done = 0
+    for key, ims in ims_dict.items():
+        img_sum = None
+        for i in range(start, stops[key]):
+            frame = frame_cache.read(key, ims, i)
+            if img_sum is None:
+                img_sum = frame.astype(float)
+            else:
+                img_sum += frame
+
+            done += 1
+            if progress is not None:
+                progress(done / total)
+
+        ret[key] = img_sum / (stops[key] - start)
+
+    return ret
+
+
+def run_powder_calibration(progress_callback=None):
+    # Calibrate a copy of the instrument, so that the shared one is
+    # left untouched if the calibration fails. It is in the "None" Euler
+    # angle convention.
     iconfig = HexrdConfig().instrument_config
-    instr = instrument.HEDMInstrument(instrument_config=iconfig,
-                                      tilt_calibration_mapping=rme)
+    instr = copy.deepcopy(HexrdConfig().instrument_snapshot())
 
     flags = HexrdConfig().get_statuses_instrument_format()
 
@@ -279,14 +499,30 @@ def run_powder_calibration():
 
     instr.calibration_flags = flags
 
+    powder_config = HexrdConfig().config['calibration']['powder']
+    num_frames = powder_config.get('num_frames', 1)
+
+    read_progress = fit_progress = None
+    if progress_callback is not None:
+        # Reading several frames takes the first half of the progress,
+        # and fitting the rings the rest
+        read_share = 0.5 if num_frames > 1 else 0.
+
+        def read_progress(fraction):
+            progress_callback.emit(int(fraction * read_share * 100))
+
+        def fit_progress(fraction):
+            fraction = read_share + fraction * (1. - read_share)
+            progress_callback.emit(int(fraction * 100))
+
     # Plane data and images
     plane_data = HexrdConfig().active_material.planeData
-    img_dict = HexrdConfig().current_images_dict()
+    img_dict = calibration_images_dict(num_frames, read_progress)
 
     # tolerances for patches
-    tth_tol = HexrdConfig().config['calibration']['powder']['tth_tol']
-    eta_tol = HexrdConfig().config['calibration']['powder']['eta_tol']
-    pktype = HexrdConfig().config['calibration']['powder']['pk_type']
+    tth_tol = powder_config['tth_tol']
+    eta_tol = powder_config['eta_tol']
+    pktype = powder_config['pk_type']
 
     # powder calibrator
     pc = PowderCalibrator(instr, plane_data, img_dict,
@@ -297,7 +533,7 @@ def run_powder_calibration():
     ic = InstrumentCalibrator(pc)
 
     use_robust_optimization = False
-    ic.run_calibration(use_robust_optimization)
+    ic.run_calibration(use_robust_optimization, fit_progress)
 
     # We might need to use this at some point
     # data_dict = pc._extract_powder_lines()
@@ -311,11 +547,16 @@ def run_powder_calibration():
     for det in output_dict['detectors'].keys():
         output_dict['detectors'][det][sl] = iconfig['detectors'][det][sl]
 
+    # Convert the tilts back to whatever convention we are using
+    eac = HexrdConfig().euler_angle_convention
+    utils.convert_tilt_convention(output_dict, (None, None), eac)
+
     # Add status values
     HexrdConfig().add_status(output_dict)
 
     # Update the config
     HexrdConfig().config['instrument'] = output_dict
+    HexrdConfig().invalidate_instrument()
 
     # Set the previous statuses to be the current statuses
     HexrdConfig().set_statuses_from_instrument_format(flags)
@@ -0,0 +1,121 @@
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+)
+from contextlib import contextmanager
+import multiprocessing
+import os
+import threading
+
+from hexrd.ui.hexrd_config import HexrdConfig
+
+EXECUTOR_TYPES = ['serial', 'thread', 'process']
+
+# The names of the executor types shown to the user
+EXECUTOR_TYPE_NAMES = ['Serial', 'Threads', 'Processes']
+
+# The executors are kept alive between jobs, per pool. When the type or
+# the number of workers of a pool changes, its executor is replaced,
+# and the old one is retired. It is only shut down once the jobs still
+# using it finish.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def num_workers(workers=None):
+    if workers is None:
+        workers = HexrdConfig().warp_workers
+    if not workers:
+        # Use all of the cores
+        workers = os.cpu_count() or 1
+    return workers
+
+
+class _ExecutorEntry:
+    """An executor along with the number of jobs using it"""
+
+    def __init__(self, executor_type, workers):
+        self.executor_type = executor_type
+        self.workers = workers
+        self.users = 0
+        self.retired = False
+
+        if executor_type == 'thread' and workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        elif executor_type == 'process' and workers > 1:
+            # The workers are spawned rather than forked. Forking this
+            # process would copy the state of the Qt and worker threads,
+            # including locks that they may be holding, into the
+            # children, where nothing can ever release them.
+            context = multiprocessing.get_context('spawn')
+            self.executor = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=context)
+        else:
+            self.executor = None
+
+    def retire(self):
+        self.retired = True
+        self.shutdown_if_unused()
+
+    def shutdown_if_unused(self):
+        if self.retired and self.users == 0 and self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+@contextmanager
+def leased_executor(pool, executor_type, workers=None):
+    """Use the executor of a pool for the duration of a job
+
+    Yields None if the jobs should be performed serially. The executor
+    is not shut down while it is in use, even if it gets replaced by
+    another thread in the meantime.
+    """
+    workers = num_workers(workers)
+    with _executors_lock:
+        entry = _executors.get(pool)
+        if (entry is None or entry.executor_type != executor_type or
+                entry.workers != workers):
+            if entry is not None:
+                entry.retire()
+            entry = _ExecutorEntry(executor_type, workers)
+            _executors[pool] = entry
+        entry.users += 1
+
+    try:
+        yield entry.executor
+    finally:
+        with _executors_lock:
+            entry.users -= 1
+            entry.shutdown_if_unused()
+
+
+def map_jobs(func, jobs, pool='warp', executor_type='serial',
+             workers=None, progress=None):
+    """Call func(*job) for every job, and return the results in order
+
+    Unless executor_type is 'serial', the jobs are run in parallel on
+    the executor of the named pool. With a process executor, func and
+    the job arguments must be picklable. workers defaults to the warp
+    workers. progress, if given, is called with the fraction of
+    finished jobs.
+    """
+    with leased_executor(pool, executor_type, workers) as executor:
+        if executor is None or len(jobs) < 2:
+            results = []
+            for i, job in enumerate(jobs):
+                results.append(func(*job))
+                if progress is not None:
+                    progress((i + 1) / len(jobs))
+            return results
+
+        futures = [executor.submit(func, *job) for job in jobs]
+        if progress is not None:
+            for i, _ in enumerate(as_completed(futures)):
+                progress((i + 1) / len(jobs))
+
+        return [f.result() for f in futures]
+
+
+def map_warps(func, jobs):
+    """Run warp jobs with the configured warp executor"""
+    return map_jobs(func, jobs, 'warp', HexrdConfig().warp_executor_type)
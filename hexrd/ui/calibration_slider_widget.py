@@ -223,12 +223,18 @@ class CalibrationSliderWidget(QObject):
             iconfig = HexrdConfig().config['instrument']
             if key == 'energy':
                 iconfig['beam'][key]['value'] = val
-                HexrdConfig().update_active_material_energy()
             elif key == 'polar':
                 iconfig['beam']['vector']['polar_angle']['value'] = val
-                self.emit_update_if_polar()
             else:
                 iconfig['beam']['vector'][key]['value'] = val
+
+            # Invalidate only after the write. Otherwise, a snapshot
+            # taken in between would cache an instrument with the old
+            # beam.
+            HexrdConfig().invalidate_instrument()
+            if key == 'energy':
+                HexrdConfig().update_active_material_energy()
+            else:
                 self.emit_update_if_polar()
 
     def update_widget_value(self, widget):
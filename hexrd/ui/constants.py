@@ -5,3 +5,39 @@ WAVELENGTH_TO_KEV = constants.keVToAngstrom(1.)
 KEV_TO_WAVELENGTH = constants.keVToAngstrom(1.)
 
 DEFAULT_CMAP = 'plasma'
+
+# While the polar view is being interacted with, preview images are
+# rendered with pixel sizes this many times larger than the configured ones
+POLAR_PREVIEW_RESOLUTION_FACTOR = 4
+
+# Milliseconds without input before the full resolution polar image is
+# rendered
+POLAR_PREVIEW_IDLE_TIME = 300
+
+# Number of frames that are warped together when exporting the polar
+# images of whole imageseries
+POLAR_BATCH_CHUNK_SIZE = 16
+
+# Maximum number of bytes of frames that are held in memory at once while
+# computing image statistics such as dark images
+IMAGE_STATS_MEMORY_BUDGET = 1 << 30
+
+# Maximum size in bytes of the on-disk cache of dark and aggregated images
+IMAGE_STATS_CACHE_SIZE = 2 << 30
+
+# Maximum number of detector files that are opened concurrently
+IMAGE_LOAD_WORKERS = 8
+
+# Default memory budget in megabytes of the cache of imageseries frames
+DEFAULT_FRAME_CACHE_SIZE = 1024
+
+# Number of frames that are read ahead in the direction of scrubbing
+FRAME_PREFETCH_COUNT = 8
+
+# The layout of raw binary (.raw, .bin) detector files
+DEFAULT_RAW_BINARY_OPTIONS = {
+    'header_size': 0,
+    'dtype': 'uint16',
+    'rows': 2048,
+    'cols': 2048,
+}
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import numpy as np
+
+
+class FrameCache:
+    """An LRU cache of imageseries frames with a memory budget
+
+    Frames are cached per imageseries name and frame index. An entry is
+    only used while the imageseries it was read from is still the one
+    stored under that name, so replacing an imageseries invalidates its
+    frames.
+
+    Every access also prefetches the next `prefetch_count` frames in the
+    direction that the frames are being scrubbed, on a background
+    thread.
+    """
+
+    def __init__(self, max_bytes, prefetch_count=0):
+        self.max_bytes = max_bytes
+        self.prefetch_count = prefetch_count
+
+        self._frames = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+        # Reads of the same imageseries are serialized, as the
+        # imageseries adapters are not thread safe
+        self._read_locks = {}
+
+        # The last accessed index and the scrubbing direction per name
+        self._last_idx = {}
+        self._direction = {}
+
+        self._executor = None
+        self._pending = set()
+
+    def get(self, name, ims, idx):
+        """Get a frame, reading it if it is not cached"""
+        frame = self._cached(name, ims, idx)
+        if frame is None:
+            frame = self._read(name, ims, idx)
+
+        self._prefetch(name, ims, idx)
+        return frame
+
+    def read(self, name, ims, idx):
+        """Read a frame without caching it or prefetching
+
+        This is for jobs that stream through whole imageseries, which
+        would otherwise evict the frames being viewed. The read is still
+        serialized with the other reads of the same imageseries. The
+        returned frame must not be modified.
+        """
+        frame = self._cached(name, ims, idx)
+        if frame is not None:
+            return frame
+
+        with self._read_lock(name):
+            return np.asarray(ims[idx])
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._nbytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _cached(self, name, ims, idx):
+        with self._lock:
+            entry = self._frames.get((name, idx))
+            if entry is None or entry[0] is not ims:
+                return None
+
+            self._frames.move_to_end((name, idx))
+            return entry[1]
+
+    def _read_lock(self, name):
+        with self._lock:
+            return self._read_locks.setdefault(name, threading.Lock())
+
+    def _read(self, name, ims, idx):
+        with self._read_lock(name):
+            # It may have been read while waiting for the lock
+            frame = self._cached(name, ims, idx)
+            if frame is not None:
+                return frame
+
+            frame = np.asarray(ims[idx])
+
+        self._store(name, ims, idx, frame)
+        return frame
+
+    def _store(self, name, ims, idx, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._frames.pop((name, idx), None)
+            if old is not None:
+                self._nbytes -= old[1].nbytes
+
+            self._frames[(name, idx)] = (ims, frame)
+            self._nbytes += frame.nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes and self._frames:
+            _, (_, frame) = self._frames.popitem(last=False)
+            self._nbytes -= frame.nbytes
+
+    def _prefetch(self, name, ims, idx):
+        if self.prefetch_count <= 0 or len(ims) < 2:
+            return
+
+        with self._lock:
+            last_idx = self._last_idx.get(name)
+            if last_idx is not None and last_idx != idx:
+                self._direction[name] = 1 if idx > last_idx else -1
+            self._last_idx[name] = idx
+            direction = self._direction.get(name, 1)
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor()
+
+            for i in range(1, self.prefetch_count + 1):
+                target = idx + i * direction
+                key = (name, target)
+                if not 0 <= target < len(ims) or key in self._pending:
+                    continue
+
+                entry = self._frames.get(key)
+                if entry is not None and entry[0] is ims:
+                    continue
+
+                self._pending.add(key)
+                self._executor.submit(self._prefetch_frame, name, ims,
+                                      target)
+
+    def _prefetch_frame(self, name, ims, idx):
+        try:
+            with self._lock:
+                # Skip frames that are no longer ahead of the scrubbing
+                last_idx = self._last_idx.get(name, idx)
+                direction = self._direction.get(name, 1)
+                ahead = (idx - last_idx) * direction
+                if not 0 < ahead <= self.prefetch_count:
+                    return
+
+            self._read(name, ims, idx)
+        except Exception:
+            # Prefetching is only an optimization. Errors will surface
+            # when the frame is actually requested.
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard((name, idx))
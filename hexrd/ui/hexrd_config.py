@@ -1,5 +1,6 @@
 import copy
 import pickle
+import threading
 
 from PySide2.QtCore import Signal, QCoreApplication, QObject, QSettings
 
@@ -7,11 +8,13 @@ import numpy as np
 import yaml
 
 import hexrd.imageseries.save
+from hexrd.instrument import HEDMInstrument
 from hexrd.rotations import RotMatEuler
 
 from hexrd.ui import constants
 from hexrd.ui import resource_loader
 from hexrd.ui import utils
+from hexrd.ui.frame_cache import FrameCache
 
 import hexrd.ui.resources.calibration
 import hexrd.ui.resources.materials
@@ -94,6 +97,39 @@ class HexrdConfig(QObject, metaclass=Singleton):
         self.previous_active_material = None
         self.collapsed_state = []
         self.load_panel_state = None
+        self.warp_executor_type = 'thread'
+        self.warp_workers = 0
+
+        # The patch fits of calibration are CPU bound, so they run on
+        # processes by default
+        self.calibration_executor_type = 'process'
+        self.calibration_workers = 0
+
+        # The layout of raw binary detector files
+        self.raw_binary_options = copy.deepcopy(
+            constants.DEFAULT_RAW_BINARY_OPTIONS)
+
+        # Frames read from the imageseries, in megabytes
+        self.frame_cache_size = constants.DEFAULT_FRAME_CACHE_SIZE
+        self.frame_cache = FrameCache(self.frame_cache_size * 2**20,
+                                      constants.FRAME_PREFETCH_COUNT)
+
+        # A long-lived instrument that mirrors config['instrument']
+        self._instrument = None
+        self._instrument_lock = threading.RLock()
+        self._stale_instrument_detectors = set()
+
+        # A cached copy of the instrument config in the "None" Euler
+        # angle convention, and the detectors whose transforms are stale
+        self._none_euler_config = None
+        self._stale_none_euler_detectors = set()
+
+        # A read-only copy of the instrument, shared by the background
+        # jobs until the instrument is modified again. The generation
+        # counts the modifications.
+        self._instrument_generation = 0
+        self._instrument_snapshot = None
+        self._snapshot_generation = None
 
         self.set_euler_angle_convention('xyz', True, convert_config=False)
 
@@ -142,6 +178,13 @@ class HexrdConfig(QObject, metaclass=Singleton):
         self.update_plane_data_tth_width()
         self.update_active_material_energy()
 
+        self.setup_connections()
+
+    def setup_connections(self):
+        self.detector_transform_modified.connect(
+            self.flag_instrument_detector_stale)
+        self.detectors_changed.connect(self.invalidate_instrument)
+
     def save_settings(self):
         settings = QSettings()
         settings.setValue('config_instrument', self.config['instrument'])
@@ -153,6 +196,13 @@ class HexrdConfig(QObject, metaclass=Singleton):
         settings.setValue('active_material', self.active_material_name())
         settings.setValue('collapsed_state', self.collapsed_state)
         settings.setValue('load_panel_state', self.load_panel_state)
+        settings.setValue('warp_executor_type', self.warp_executor_type)
+        settings.setValue('warp_workers', self.warp_workers)
+        settings.setValue('calibration_executor_type',
+                          self.calibration_executor_type)
+        settings.setValue('calibration_workers', self.calibration_workers)
+        settings.setValue('frame_cache_size', self.frame_cache_size)
+        settings.setValue('raw_binary_options', self.raw_binary_options)
 
     def load_settings(self):
         settings = QSettings()
@@ -169,6 +219,18 @@ class HexrdConfig(QObject, metaclass=Singleton):
         self.previous_active_material = settings.value('active_material', None)
         self.collapsed_state = settings.value('collapsed_state', [])
         self.load_panel_state = settings.value('load_panel_state', None)
+        self.warp_executor_type = settings.value('warp_executor_type',
+                                                 'thread')
+        self.warp_workers = int(settings.value('warp_workers', 0))
+        self.calibration_executor_type = settings.value(
+            'calibration_executor_type', 'process')
+        self.calibration_workers = int(settings.value('calibration_workers',
+                                                      0))
+        self.set_frame_cache_size(int(settings.value(
+            'frame_cache_size', constants.DEFAULT_FRAME_CACHE_SIZE)))
+        self.raw_binary_options = settings.value(
+            'raw_binary_options',
+            copy.deepcopy(constants.DEFAULT_RAW_BINARY_OPTIONS))
 
     def emit_update_status_bar(self, msg):
         """Convenience signal to update the main window's status bar"""
@@ -201,6 +263,7 @@ class HexrdConfig(QObject, metaclass=Singleton):
             utils.convert_tilt_convention(self.config['instrument'], old_eac,
                                           new_eac)
 
+        self.invalidate_instrument()
         self.rerender_needed.emit()
         self.update_active_material_energy()
 
@@ -261,7 +324,9 @@ class HexrdConfig(QObject, metaclass=Singleton):
                 self._recursive_set_defaults(current[key], default[key])
 
     def image(self, name, idx):
-        return self.imageseries(name)[idx]
+        # Copy the cached frame, as the viewers may draw on the images
+        ims = self.imageseries(name)
+        return self.frame_cache.get(name, ims, idx).copy()
 
     def imageseries(self, name):
         return self.imageseries_dict.get(name)
@@ -300,6 +365,7 @@ class HexrdConfig(QObject, metaclass=Singleton):
         # Create a backup
         self.backup_instrument_config()
 
+        self.invalidate_instrument()
         self.update_active_material_energy()
         return self.config['instrument']
 
@@ -326,6 +392,28 @@ class HexrdConfig(QObject, metaclass=Singleton):
     def set_live_update(self, status):
         self.live_update = status
 
+    def set_warp_executor(self, executor_type, workers):
+        """Set the executor used to warp detectors in parallel
+
+        executor_type may be 'serial', 'thread', or 'process'. If
+        workers is 0, the number of cores is used.
+        """
+        self.warp_executor_type = executor_type
+        self.warp_workers = workers
+
+    def set_calibration_executor(self, executor_type, workers):
+        """Set the executor used to fit calibration patches in parallel
+
+        This takes the same values as set_warp_executor().
+        """
+        self.calibration_executor_type = executor_type
+        self.calibration_workers = workers
+
+    def set_frame_cache_size(self, size):
+        """Set the memory budget of the frame cache, in megabytes"""
+        self.frame_cache_size = size
+        self.frame_cache.set_max_bytes(size * 2**20)
+
     def create_internal_config(self, cur_config):
         if not self.has_status(cur_config):
             self.add_status(cur_config)
@@ -527,6 +615,12 @@ class HexrdConfig(QObject, metaclass=Singleton):
                    str(self.config['instrument']))
             raise Exception(msg)
 
+        # Detector transforms are updated on the instrument incrementally,
+        # and statuses do not modify the instrument at all.
+        is_transform = path[0] == 'detectors' and path[2] == 'transform'
+        if not is_transform and path[-1] != 'status':
+            self.invalidate_instrument()
+
         # If the beam energy was modified, update the active material
         if path == ['beam', 'energy', 'value']:
             self.update_active_material_energy()
@@ -836,6 +930,16 @@ class HexrdConfig(QObject, metaclass=Singleton):
     polar_snip1d_numiter = property(_polar_snip1d_numiter,
                                     set_polar_snip1d_numiter)
 
+    def _polar_warp_engine(self):
+        return self.config['image']['polar']['warp_engine']
+
+    def set_polar_warp_engine(self, v):
+        self.config['image']['polar']['warp_engine'] = v
+        self.rerender_needed.emit()
+
+    polar_warp_engine = property(_polar_warp_engine,
+                                 set_polar_warp_engine)
+
     def _cartesian_pixel_size(self):
         return self.config['image']['cartesian']['pixel_size']
 
@@ -922,15 +1026,126 @@ class HexrdConfig(QObject, metaclass=Singleton):
             utils.convert_tilt_convention(self.config['instrument'], old_conv,
                                           new_conv)
 
+        # The tilt calibration mapping has changed
+        self.invalidate_instrument()
+
         # Set the variable
         self._euler_angle_convention = new_conv
 
     @property
     def instrument_config_none_euler_convention(self):
-        iconfig = self.instrument_config
-        eac = self.euler_angle_convention
-        utils.convert_tilt_convention(iconfig, eac, (None, None))
-        return iconfig
+        """The instrument config converted to the "None" convention
+
+        This is cached, and only the modified parts are recomputed. The
+        returned dict must not be modified.
+        """
+        with self._instrument_lock:
+            stale = self._stale_none_euler_detectors
+            if self._none_euler_config is None:
+                iconfig = self.instrument_config
+                eac = self.euler_angle_convention
+                utils.convert_tilt_convention(iconfig, eac, (None, None))
+                self._none_euler_config = iconfig
+                stale.clear()
+
+            while stale:
+                self._update_none_euler_detector(stale.pop())
+
+            return self._none_euler_config
+
+    def _update_none_euler_detector(self, det):
+        detectors = self._none_euler_config['detectors']
+        if det not in detectors:
+            # The detectors do not match anymore. Rebuild it.
+            self._none_euler_config = None
+            self.instrument_config_none_euler_convention
+            return
+
+        transform = copy.deepcopy(self.get_detector(det)['transform'])
+        self.remove_status(transform)
+        tilt_config = {'detectors': {det: {'transform': transform}}}
+        utils.convert_tilt_convention(tilt_config,
+                                      self.euler_angle_convention,
+                                      (None, None))
+        detectors[det]['transform'] = transform
+
+    @property
+    def instrument(self):
+        """A long-lived HEDMInstrument built from the instrument config
+
+        Detector transform modifications are applied to it in place and
+        incrementally. Any other modification of the instrument config
+        must call invalidate_instrument(), so that it gets rebuilt the
+        next time it is requested.
+
+        Since it is modified in place, this must only be used while
+        holding the instrument lock. Work that runs in the background
+        should use instrument_snapshot() instead.
+        """
+        with self._instrument_lock:
+            stale = self._stale_instrument_detectors
+            if (self._instrument is not None and
+                    set(self._instrument.detectors) !=
+                    set(self.get_detector_names())):
+                # The detectors do not match anymore. Rebuild it.
+                self._instrument = None
+
+            if self._instrument is None:
+                # HEDMInstrument expects None Euler angle convention for
+                # the config. Let's get it as such.
+                iconfig = self.instrument_config_none_euler_convention
+                rme = self.rotation_matrix_euler()
+                self._instrument = HEDMInstrument(
+                    instrument_config=iconfig, tilt_calibration_mapping=rme)
+                stale.clear()
+
+            while stale:
+                self._update_instrument_detector(stale.pop())
+
+            return self._instrument
+
+    def instrument_snapshot(self):
+        """A copy of the instrument, taken under the lock
+
+        Renders, polar batches and calibration run on worker threads,
+        while the GUI thread keeps applying detector transform changes
+        to the long-lived instrument. Each job takes a snapshot once,
+        so that it sees a single, consistent geometry throughout.
+
+        The snapshot is shared until the instrument is modified again,
+        so it must not be modified. Copy it first to do so.
+        """
+        with self._instrument_lock:
+            if self._snapshot_generation != self._instrument_generation:
+                self._instrument_snapshot = copy.deepcopy(self.instrument)
+                self._snapshot_generation = self._instrument_generation
+
+            return self._instrument_snapshot
+
+    def invalidate_instrument(self):
+        """Rebuild the instrument and its config the next time requested
+        """
+        with self._instrument_lock:
+            self._instrument_generation += 1
+            self._instrument = None
+            self._stale_instrument_detectors.clear()
+            self._none_euler_config = None
+            self._stale_none_euler_detectors.clear()
+
+    def flag_instrument_detector_stale(self, det):
+        """Update a detector's transform the next time it is requested"""
+        with self._instrument_lock:
+            self._instrument_generation += 1
+            self._stale_instrument_detectors.add(det)
+            self._stale_none_euler_detectors.add(det)
+
+    def _update_instrument_detector(self, det):
+        iconfig = self.instrument_config_none_euler_convention
+        transform = iconfig['detectors'][det]['transform']
+
+        panel = self._instrument.detectors[det]
+        panel.tvec = transform['translation']
+        panel.tilt = transform['tilt']
 
     @property
     def euler_angle_convention(self):
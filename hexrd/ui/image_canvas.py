@@ -1,7 +1,7 @@
 import copy
 import math
 
-from PySide2.QtCore import QThreadPool
+from PySide2.QtCore import QThreadPool, QTimer
 
 from matplotlib.backends.backend_qt5agg import FigureCanvas
 
@@ -10,10 +10,10 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 
-from hexrd.ui.async_worker import AsyncWorker
 from hexrd.ui.calibration.cartesian_plot import cartesian_viewer
 from hexrd.ui.calibration.polar_plot import polar_viewer
 from hexrd.ui.hexrd_config import HexrdConfig
+from hexrd.ui.render_scheduler import RenderScheduler
 from hexrd.ui.utils import run_snip1d
 import hexrd.ui.constants
 
@@ -50,6 +50,23 @@ class ImageCanvas(FigureCanvas):
         # Set up our async stuff
         self.thread_pool = QThreadPool(parent)
 
+        # Only the newest render is delivered. Older ones are cancelled.
+        self.render_scheduler = RenderScheduler(self.thread_pool, self)
+
+        # While polar renders are requested in quick succession, coarse
+        # previews are rendered. The full resolution image is rendered
+        # once this timer runs out.
+        self.polar_idle_timer = QTimer(self)
+        self.polar_idle_timer.setSingleShot(True)
+        self.polar_idle_timer.setInterval(
+            hexrd.ui.constants.POLAR_PREVIEW_IDLE_TIME)
+        self.polar_idle_timer.timeout.connect(self.on_polar_idle)
+        self.polar_fine_render_pending = False
+
+        # Detectors whose transforms were modified since the last render
+        # that was delivered
+        self.modified_detectors = set()
+
         if image_names is not None:
             self.load_images(image_names)
 
@@ -67,6 +84,7 @@ class ImageCanvas(FigureCanvas):
         plt.close(self.figure)
 
     def clear(self):
+        self.render_scheduler.cancel()
         self.iviewer = None
         self.figure.clear()
         self.axes_images.clear()
@@ -246,14 +264,12 @@ class ImageCanvas(FigureCanvas):
             self.axes_images.clear()
 
         # Run the calibration in a background thread
-        worker = AsyncWorker(cartesian_viewer)
-        self.thread_pool.start(worker)
-
-        # Get the results and close the progress dialog when finished
-        worker.signals.result.connect(self.finish_show_cartesian)
+        self.render_scheduler.submit(cartesian_viewer,
+                                     self.finish_show_cartesian)
 
     def finish_show_cartesian(self, iviewer):
         self.iviewer = iviewer
+        self.modified_detectors.clear()
         img = self.iviewer.img
 
         # It is important to persist the plot so that we don't reset the scale.
@@ -299,15 +315,34 @@ class ImageCanvas(FigureCanvas):
 
         self.polar_res_config = polar_res_config.copy()
 
-        # Run the calibration in a background thread
-        worker = AsyncWorker(polar_viewer)
-        self.thread_pool.start(worker)
+        if self.polar_idle_timer.isActive():
+            # We are being interacted with. Render a coarse preview now,
+            # and the full resolution image once the input is idle.
+            factor = hexrd.ui.constants.POLAR_PREVIEW_RESOLUTION_FACTOR
+            self.start_polar_render(factor)
+            self.polar_fine_render_pending = True
+        else:
+            self.start_polar_render()
 
-        # Get the results and close the progress dialog when finished
-        worker.signals.result.connect(self.finish_show_polar)
+        self.polar_idle_timer.start()
+
+    def on_polar_idle(self):
+        if not self.polar_fine_render_pending:
+            return
+
+        self.polar_fine_render_pending = False
+        if self.mode == 'polar':
+            self.start_polar_render()
+
+    def start_polar_render(self, resolution_factor=1):
+        # Run the calibration in a background thread. This supersedes
+        # any render that is still queued or running.
+        self.render_scheduler.submit(polar_viewer, self.finish_show_polar,
+                                     resolution_factor)
 
     def finish_show_polar(self, iviewer):
         self.iviewer = iviewer
+        self.modified_detectors.clear()
         img = self.iviewer.img
         extent = self.iviewer._extent
 
@@ -336,7 +371,7 @@ class ImageCanvas(FigureCanvas):
 
             if self.azimuthal_integral_axis is None:
                 axis = self.figure.add_subplot(grid[2, 0], sharex=self.axis)
-                axis.plot(tth, np.sum(img, axis=0))
+                axis.plot(tth, self.iviewer.azimuthal_integral)
 
                 # Turn off autoscale so modifying the rings does not
                 # rescale the y axis.
@@ -348,7 +383,7 @@ class ImageCanvas(FigureCanvas):
             else:
                 axis = self.azimuthal_integral_axis
                 axis.clear()
-                axis.plot(tth, np.sum(img, axis=0))
+                axis.plot(tth, self.iviewer.azimuthal_integral)
 
             # These need to be set every time for some reason
             self.axis.label_outer()
@@ -406,7 +441,34 @@ class ImageCanvas(FigureCanvas):
         if not self.iviewer:
             return
 
-        self.iviewer.update_detector(det)
+        # Detectors modified by superseded updates are carried over
+        self.modified_detectors.add(det)
+
+        if self.mode == 'polar':
+            coarse = (self.iviewer.resolution_factor != 1 or
+                      self.polar_fine_render_pending)
+            if self.polar_idle_timer.isActive() or coarse:
+                # We are being interacted with, or only a coarse preview
+                # is displayed. Render a coarse preview now, and the full
+                # resolution image once the input is idle.
+                self.show_polar()
+                return
+
+            # Keep the timer running, so that a drag that continues is
+            # rendered as coarse previews
+            self.polar_idle_timer.start()
+
+        # Update only the modified detectors of the displayed viewer, in
+        # the background. This supersedes any render still in progress.
+        detectors = set(self.modified_detectors)
+        self.render_scheduler.submit(
+            self.iviewer.updated,
+            lambda iviewer: self.finish_update_detectors(iviewer, detectors),
+            detectors)
+
+    def finish_update_detectors(self, iviewer, detectors):
+        self.iviewer = iviewer
+        self.modified_detectors -= detectors
         self.axes_images[0].set_data(self.iviewer.img)
         self.draw()
 
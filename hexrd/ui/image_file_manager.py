@@ -1,13 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-import tempfile
 import yaml
 
 from PySide2.QtWidgets import QMessageBox
 
 from hexrd import imageseries
 
+from hexrd.ui import constants
 from hexrd.ui.hexrd_config import HexrdConfig
+from hexrd.ui.image_files_adapter import open_image_files
 from hexrd.ui.load_hdf5_dialog import LoadHDF5Dialog
+from hexrd.ui.raw_binary_adapter import (
+    GE_EXTS, RAW_EXTS, open_ge, open_raw_binary
+)
 
 
 class Singleton(type):
@@ -32,19 +37,19 @@ class ImageFileManager(metaclass=Singleton):
         self.remember = True
         self.path = []
 
-    def load_images(self, detectors, file_names):
+    def load_images(self, detectors, file_names, progress=None):
         HexrdConfig().imageseries_dict.clear()
-        for name, f in zip(detectors, file_names):
-            try:
-                if isinstance(f, list):
-                    f = f[0]
-
-                ims = self.open_file(f)
-                HexrdConfig().imageseries_dict[name] = ims
-            except (Exception, IOError) as error:
-                msg = ('ERROR - Could not read file: \n' + str(error))
-                QMessageBox.warning(None, 'HEXRD', msg)
-                return
+        HexrdConfig().frame_cache.clear()
+        file_names = [f[0] if isinstance(f, list) else f
+                      for f in file_names]
+        args = [(f,) for f in file_names]
+        results, errors = self.open_concurrently(detectors, self.open_file,
+                                                 args, progress)
+        if errors:
+            # The caller shows the errors on the GUI thread
+            return errors
+
+        HexrdConfig().imageseries_dict.update(results)
 
         # Save the path if it should be remembered
         if self.remember:
@@ -52,16 +57,63 @@ class ImageFileManager(metaclass=Singleton):
         else:
             HexrdConfig().hdf5_path = self.path
 
-    def load_aps_imageseries(self, detectors, directory_names):
+    def load_aps_imageseries(self, detectors, directory_names,
+                             progress=None):
         HexrdConfig().imageseries_dict.clear()
-        for name, d in zip(detectors, directory_names):
-            try:
-                ims = self.open_directory(d)
-                HexrdConfig().imageseries_dict[name] = ims
-            except (Exception, IOError) as error:
-                msg = ('ERROR - Could not read file: \n' + str(error))
-                QMessageBox.warning(None, 'HEXRD', msg)
-                return
+        HexrdConfig().frame_cache.clear()
+        args = [(d,) for d in directory_names]
+        results, errors = self.open_concurrently(detectors,
+                                                 self.open_directory, args,
+                                                 progress)
+        if errors:
+            # The caller shows the errors on the GUI thread
+            return errors
+
+        HexrdConfig().imageseries_dict.update(results)
+
+    def open_concurrently(self, names, func, args, progress=None):
+        """Call func(*arg) for each name and arg on a thread pool
+
+        The headers and metadata of each imageseries are read on the
+        pool as well, so that the I/O latency of all of the detectors
+        overlaps. progress, if given, is called as progress(name, done,
+        total) each time a detector finishes.
+
+        Returns a dict of the opened imageseries, in the order of names,
+        and a list of (name, error) for those that could not be opened.
+        """
+        def open_ims(*arg):
+            ims = func(*arg)
+            # Force the headers and metadata to be read
+            len(ims)
+            ims.metadata
+            return ims
+
+        opened = {}
+        errors = []
+        workers = max(min(len(names), constants.IMAGE_LOAD_WORKERS), 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(open_ims, *arg): name
+                       for name, arg in zip(names, args)}
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    opened[name] = future.result()
+                except (Exception, IOError) as error:
+                    errors.append((name, error))
+
+                if progress is not None:
+                    progress(name, done, len(names))
+
+        results = {name: opened[name] for name in names if name in opened}
+        errors.sort(key=lambda x: names.index(x[0]))
+        return results, errors
+
+    def show_errors(self, errors):
+        # This must be called on the GUI thread
+        msg = 'ERROR - Could not read file(s): \n'
+        msg += '\n'.join(name + ': ' + str(error) for name, error in errors)
+        QMessageBox.warning(None, 'HEXRD', msg)
 
     def open_file(self, f):
         ext = os.path.splitext(f)[1]
@@ -71,28 +123,21 @@ class ImageFileManager(metaclass=Singleton):
                 dataname=HexrdConfig().hdf5_path[1])
         elif ext == '.npz':
             ims = imageseries.open(f, 'frame-cache')
+        elif ext.lower() in GE_EXTS:
+            # Memory-map the frames instead of reading them
+            ims = open_ge(f)
+        elif ext.lower() in RAW_EXTS:
+            options = HexrdConfig().raw_binary_options
+            shape = (options['rows'], options['cols'])
+            ims = open_raw_binary(f, shape, options['dtype'],
+                                  options['header_size'])
         elif ext == '.yml':
             data = yaml.load(open(f))
             form = next(iter(data))
             ims = imageseries.open(f, form)
         else:
             # elif ext in self.IMAGE_FILE_EXTS:
-            input_dict = {
-                'image-files': {}
-            }
-            input_dict['image-files']['directory'] = os.path.dirname(f)
-            input_dict['image-files']['files'] = os.path.basename(f)
-            input_dict['options'] = {}
-            input_dict['meta'] = {}
-            temp = tempfile.NamedTemporaryFile(delete=False)
-            try:
-                data = yaml.dump(input_dict).encode('utf-8')
-                temp.write(data)
-                temp.close()
-                ims = imageseries.open(temp.name, 'image-files')
-            finally:
-                # Ensure the file gets removed from the filesystem
-                os.remove(temp.name)
+            ims = open_image_files(os.path.dirname(f), [os.path.basename(f)])
         # else:
         #     ims = imageseries.open(f, 'array')
         return ims
@@ -101,29 +146,8 @@ class ImageFileManager(metaclass=Singleton):
         if files is None:
             files = os.listdir(d)
 
-        input_dict = {
-            'image-files': {}
-        }
-        input_dict['image-files']['directory'] = d
-        file_str = ''
-        for i, f in enumerate(files):
-            file_str += os.path.basename(f)
-            if i != len(files) - 1:
-                file_str += ' '
-
-        input_dict['image-files']['files'] = file_str
-        input_dict['options'] = {}
-        input_dict['meta'] = {}
-        temp = tempfile.NamedTemporaryFile(delete=False)
-        try:
-            data = yaml.dump(input_dict).encode('utf-8')
-            temp.write(data)
-            temp.close()
-            ims = imageseries.open(temp.name, 'image-files')
-        finally:
-            # Ensure the file gets removed from the filesystem
-            os.remove(temp.name)
-        return ims
+        files = [os.path.basename(f) for f in files]
+        return open_image_files(d, files)
 
     def is_hdf5(self, extension):
         hdf5_extensions = ['.h5', '.hdf5', '.he5']
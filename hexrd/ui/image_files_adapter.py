@@ -0,0 +1,107 @@
+import glob
+import os
+import threading
+
+import fabio
+import numpy as np
+
+from hexrd.imageseries.baseclass import ImageSeries
+
+
+def expand_files(directory, files):
+    """Expand the file names and glob patterns relative to directory
+
+    Names are kept in the order given. The matches of each pattern are
+    sorted, as in the 'image-files' imageseries format.
+    """
+    if isinstance(files, str):
+        files = files.split()
+
+    expanded = []
+    for f in files:
+        path = os.path.join(directory, f)
+        if glob.has_magic(path):
+            expanded.extend(sorted(glob.glob(path)))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def open_image_files(directory, files):
+    """Create an imageseries straight from a directory and file names"""
+    return ImageSeries(ImageFilesAdapter(directory, files))
+
+
+class ImageFilesAdapter:
+    """In-memory equivalent of the 'image-files' imageseries adapter
+
+    The hexrd adapter can only be created from a YAML file. This one
+    takes the directory and the file names directly, so no YAML needs
+    to be written to disk and parsed again.
+
+    If the first file holds a single frame, all of the files are assumed
+    to hold single frames, so that only the first file needs to be
+    opened to build the series.
+
+    Empty frames are not dropped here. The load panel skips them when
+    it processes the frames.
+
+    Frames may be read from several threads at once. Each thread keeps
+    its own last opened file.
+    """
+
+    def __init__(self, directory, files):
+        self._files = expand_files(directory, files)
+        if not self._files:
+            raise Exception('No image files found in ' + directory)
+
+        self._meta = {}
+        self._local = threading.local()
+
+        first = self._fabio_open(0)
+        if first.nframes == 1:
+            self._frames = [(i, 0) for i in range(len(self._files))]
+        else:
+            self._frames = []
+            for i in range(len(self._files)):
+                nframes = self._fabio_open(i).nframes
+                self._frames.extend((i, j) for j in range(nframes))
+
+        first_frame = self[0]
+        self._dtype = first_frame.dtype
+        self._shape = first_frame.shape
+
+    def _fabio_open(self, idx):
+        # Keep the last file open, for series of multi-frame files. The
+        # fabio images hold the state of the open file, so they are not
+        # shared between threads.
+        open_file = getattr(self._local, 'open_file', (None, None))
+        if open_file[0] != idx:
+            open_file = (idx, fabio.open(self._files[idx]))
+            self._local.open_file = open_file
+        return open_file[1]
+
+    def __getitem__(self, key):
+        idx, frame = self._frames[key]
+        img = self._fabio_open(idx)
+        if frame > 0 or img.nframes > 1:
+            img = img.getframe(frame)
+        return np.asarray(img.data)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def metadata(self):
+        return self._meta
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        return self._shape
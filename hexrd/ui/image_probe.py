@@ -0,0 +1,151 @@
+# Read the frame count, shape, dtype, and omegas of image files from their
+# headers only, without opening them as imageseries
+
+from collections import namedtuple
+import os
+
+import h5py
+import numpy as np
+from PIL import Image
+import yaml
+
+from hexrd.ui.hexrd_config import HexrdConfig
+from hexrd.ui.image_file_manager import ImageFileManager
+from hexrd.ui.image_files_adapter import expand_files
+from hexrd.ui.raw_binary_adapter import (
+    GE_DTYPE, GE_EXTS, GE_HEADER_SIZE, GE_SHAPE, RAW_EXTS, is_ge_layout,
+    raw_binary_nframes
+)
+
+ProbeResult = namedtuple('ProbeResult', ['nframes', 'shape', 'dtype',
+                                         'omega'])
+
+HDF5_EXTS = ['.h5', '.hdf5', '.he5']
+TIFF_EXTS = ['.tiff', '.tif']
+
+# Pillow image modes and their dtypes
+PIL_MODE_DTYPES = {
+    '1': np.bool_,
+    'L': np.uint8,
+    'P': np.uint8,
+    'I;16': np.uint16,
+    'I;16B': np.uint16,
+    'I': np.int32,
+    'F': np.float32,
+}
+
+# Results are cached on (path, mtime), so changed files are probed again
+_probe_cache = {}
+
+
+def probe(path):
+    """Probe an image file, or fully open it if it has no known header"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns)
+    if os.path.splitext(path)[1].lower() in HDF5_EXTS:
+        key += tuple(HexrdConfig().hdf5_path)
+
+    result = _probe_cache.get(key)
+    if result is None:
+        result = _probe(path, st.st_size)
+        _probe_cache[key] = result
+    return result
+
+
+def _probe(path, size):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in HDF5_EXTS:
+        return probe_hdf5(path)
+    elif ext == '.npz':
+        return probe_frame_cache(path)
+    elif ext == '.yml':
+        return probe_yml(path)
+    elif ext in TIFF_EXTS:
+        return probe_tiff(path)
+    elif ext in GE_EXTS and is_ge_layout(size):
+        return probe_ge(size)
+    elif ext in RAW_EXTS:
+        return probe_raw_binary(size)
+
+    return probe_imageseries(path)
+
+
+def probe_hdf5(path):
+    group, dataname = HexrdConfig().hdf5_path
+    with h5py.File(path, 'r') as f:
+        g = f[group]
+        dset = g[dataname]
+        omega = g.attrs.get('omega')
+        return ProbeResult(dset.shape[0], dset.shape[1:], dset.dtype,
+                           _omega(omega))
+
+
+def probe_frame_cache(path):
+    # Only the requested members of the npz file are read
+    with np.load(path, allow_pickle=True) as f:
+        shape = tuple(f['shape'])
+        omega = f['omega'] if 'omega' in f.files else None
+        return ProbeResult(int(f['nframes']), shape,
+                           np.dtype(_npz_str(f['dtype'])), _omega(omega))
+
+
+def _npz_str(value):
+    # Depending on the writer, strings are stored in npz files as str
+    # or as bytes arrays
+    value = np.asarray(value).item()
+    if isinstance(value, bytes):
+        value = value.decode()
+    return str(value)
+
+
+def probe_tiff(path):
+    with Image.open(path) as img:
+        nframes = getattr(img, 'n_frames', 1)
+        dtype = PIL_MODE_DTYPES.get(img.mode, np.uint16)
+        return ProbeResult(nframes, img.size[::-1], np.dtype(dtype), None)
+
+
+def probe_ge(size):
+    nframes = raw_binary_nframes(size, GE_SHAPE, GE_DTYPE, GE_HEADER_SIZE)
+    return ProbeResult(nframes, GE_SHAPE, GE_DTYPE, None)
+
+
+def probe_raw_binary(size):
+    options = HexrdConfig().raw_binary_options
+    shape = (options['rows'], options['cols'])
+    dtype = np.dtype(options['dtype'])
+    nframes = raw_binary_nframes(size, shape, dtype, options['header_size'])
+    return ProbeResult(nframes, shape, dtype, None)
+
+
+def probe_yml(path):
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f)
+
+    if 'image-files' not in data:
+        return probe_imageseries(path)
+
+    image_files = data['image-files']
+    files = expand_files(image_files['directory'], image_files['files'])
+    empty_frames = data.get('options', {}).get('empty-frames', 0)
+
+    results = [probe(f) for f in files]
+    nframes = sum(r.nframes - empty_frames for r in results)
+
+    omega = data.get('meta', {}).get('omega')
+    omega = omega if not isinstance(omega, str) else None
+    return ProbeResult(nframes, results[0].shape, results[0].dtype,
+                       _omega(omega))
+
+
+def probe_imageseries(path):
+    # Fall back to opening the file
+    ims = ImageFileManager().open_file(path)
+    return ProbeResult(len(ims), ims.shape, ims.dtype,
+                       _omega(ims.metadata.get('omega')))
+
+
+def _omega(omega):
+    if omega is None:
+        return None
+    return np.asarray(omega)
@@ -0,0 +1,183 @@
+# Streaming image statistics over imageseries, with an on-disk cache
+
+import hashlib
+import os
+
+import numpy as np
+
+from PySide2.QtCore import QStandardPaths
+
+from hexrd.ui import constants
+
+
+def frames_per_chunk(ims):
+    """The number of frames of ims that fit in the memory budget"""
+    frame_nbytes = np.asarray(ims[0]).nbytes
+    return max(int(constants.IMAGE_STATS_MEMORY_BUDGET // frame_nbytes), 1)
+
+
+def iter_chunks(ims, nframes, progress=None):
+    """Yield (n, rows, cols) stacks of the first nframes frames of ims
+
+    progress, if given, is called with the fraction of frames read.
+    """
+    chunk_size = frames_per_chunk(ims)
+    for start in range(0, nframes, chunk_size):
+        stop = min(start + chunk_size, nframes)
+        yield np.array([ims[i] for i in range(start, stop)])
+
+        if progress is not None:
+            progress(stop / nframes)
+
+
+def average(ims, nframes=None, progress=None):
+    """The mean of the first nframes frames, computed chunk by chunk"""
+    if nframes is None:
+        nframes = len(ims)
+
+    total = np.zeros(np.shape(ims[0]))
+    for chunk in iter_chunks(ims, nframes, progress):
+        total += chunk.sum(axis=0)
+
+    return total / nframes
+
+
+def maximum(ims, nframes=None, progress=None):
+    """The maximum of the first nframes frames, computed chunk by chunk"""
+    if nframes is None:
+        nframes = len(ims)
+
+    result = None
+    for chunk in iter_chunks(ims, nframes, progress):
+        chunk_max = chunk.max(axis=0)
+        if result is None:
+            result = chunk_max
+        else:
+            np.maximum(result, chunk_max, out=result)
+
+    return result.astype(float)
+
+
+def median(ims, nframes=None, progress=None):
+    """The median of the first nframes frames
+
+    This is exact if all of the frames fit in the memory budget.
+    Otherwise, it is the median of the medians of the chunks, which
+    approximates the median for series whose frames are similar, as is
+    the case for dark series.
+    """
+    if nframes is None:
+        nframes = len(ims)
+
+    medians = [np.median(chunk, axis=0)
+               for chunk in iter_chunks(ims, nframes, progress)]
+    if len(medians) == 1:
+        return medians[0]
+
+    return np.median(medians, axis=0)
+
+
+STATS_FUNCTIONS = {
+    'average': average,
+    'max': maximum,
+    'median': median,
+}
+
+
+def cache_dir():
+    location = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+    return os.path.join(location, 'image_stats')
+
+
+def cache_key(stat, files, nframes, params=()):
+    """Hash everything that the result depends upon
+
+    This is the stat, the frame count, any extra processing parameters,
+    and the path, size, and mtime of each source file. Hashing the file
+    contents instead would cost as much as recomputing the statistic.
+    """
+    h = hashlib.sha1()
+    h.update(repr((stat, nframes, tuple(params))).encode())
+    for f in files:
+        st = os.stat(f)
+        h.update(repr((os.path.abspath(f), st.st_size,
+                        st.st_mtime_ns)).encode())
+    return h.hexdigest()
+
+
+def load_cached(path):
+    """Load a cached image, or return None if it is missing or corrupt"""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            image = data['image']
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Mark the entry as recently used for the LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return image
+
+
+def store_cached(path, image):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(path, image=image)
+        prune_cache()
+    except OSError:
+        # Caching is only an optimization
+        pass
+
+
+def prune_cache(max_size=None):
+    """Remove the least recently used entries above the size cap"""
+    if max_size is None:
+        max_size = constants.IMAGE_STATS_CACHE_SIZE
+
+    entries = []
+    with os.scandir(cache_dir()) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith('.npz'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(x[1] for x in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+
+        os.remove(path)
+        total -= size
+
+
+def compute(stat, ims, nframes=None, files=None, progress=None, params=()):
+    """Compute a statistic over the first nframes frames of ims
+
+    stat is one of STATS_FUNCTIONS. If the source files of ims are
+    given, the result is cached on disk, and reused for as long as the
+    files and the processing params are unchanged.
+    """
+    if nframes is None:
+        nframes = len(ims)
+
+    func = STATS_FUNCTIONS[stat]
+    if not files:
+        return func(ims, nframes, progress)
+
+    key = cache_key(stat, files, nframes, params)
+    path = os.path.join(cache_dir(), key + '.npz')
+    result = load_cached(path)
+    if result is not None:
+        if progress is not None:
+            progress(1)
+        return result
+
+    result = func(ims, nframes, progress)
+    store_cached(path, result)
+    return result
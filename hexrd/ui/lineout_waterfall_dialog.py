@@ -0,0 +1,85 @@
+from PySide2.QtCore import QThreadPool
+from PySide2.QtWidgets import QFileDialog, QMessageBox
+
+from matplotlib.backends.backend_qt5agg import FigureCanvas
+from matplotlib.figure import Figure
+
+import numpy as np
+
+from hexrd.ui.async_worker import AsyncWorker
+from hexrd.ui.cal_progress_dialog import CalProgressDialog
+from hexrd.ui.calibration.polar_batch import AzimuthalIntegrator
+from hexrd.ui.hexrd_config import HexrdConfig
+from hexrd.ui.ui_loader import UiLoader
+import hexrd.ui.constants
+
+
+class LineoutWaterfallDialog:
+
+    def __init__(self, parent=None):
+        loader = UiLoader()
+        self.ui = loader.load_file('lineout_waterfall_dialog.ui', parent)
+
+        self.integrator = AzimuthalIntegrator()
+        self.thread_pool = QThreadPool(self.ui)
+
+        self.figure = Figure()
+        self.canvas = FigureCanvas(self.figure)
+        self.ui.canvas_layout.addWidget(self.canvas)
+        self.axis = self.figure.add_subplot(111)
+
+        self.setup_connections()
+
+    def setup_connections(self):
+        self.ui.update.pressed.connect(self.update_lineouts)
+        self.ui.export_lineouts.pressed.connect(self.export_lineouts)
+
+    def show(self):
+        self.ui.show()
+        self.update_lineouts()
+
+    def update_lineouts(self):
+        # Integrate the new frames in a background thread
+        worker = AsyncWorker(self.integrator.update, progress_callback=None)
+        self.thread_pool.start(worker)
+
+        progress_dialog = CalProgressDialog(self.ui)
+        progress_dialog.setWindowTitle('Integrating Frames')
+        progress_dialog.setRange(0, 100)
+        worker.signals.progress.connect(progress_dialog.setValue)
+        worker.signals.result.connect(self.update_plot)
+        worker.signals.error.connect(self.integration_failed)
+        worker.signals.finished.connect(progress_dialog.accept)
+        progress_dialog.exec_()
+
+    def integration_failed(self, error):
+        QMessageBox.critical(self.ui, 'HEXRD', str(error[1]))
+
+    def update_plot(self, lineouts):
+        self.axis.clear()
+        if len(lineouts) == 0:
+            self.canvas.draw()
+            return
+
+        tth = np.degrees(self.integrator.tth)
+        extent = (tth[0], tth[-1], len(lineouts) - 0.5, -0.5)
+        self.axis.imshow(lineouts, cmap=hexrd.ui.constants.DEFAULT_CMAP,
+                         aspect='auto', interpolation='none', extent=extent)
+        self.axis.set_xlabel(r'2$\theta$ (deg)')
+        self.axis.set_ylabel('Frame')
+        self.canvas.draw()
+
+    def export_lineouts(self):
+        selected_file, selected_filter = QFileDialog.getSaveFileName(
+            self.ui, 'Save Azimuthal Lineouts', HexrdConfig().working_dir,
+            'HDF5 files (*.h5 *.hdf5);; NPZ files (*.npz)')
+
+        if not selected_file:
+            return
+
+        if self.integrator.tth is None:
+            msg = 'No lineouts have been integrated yet'
+            QMessageBox.warning(self.ui, 'HEXRD', msg)
+            return
+
+        self.integrator.write(selected_file)
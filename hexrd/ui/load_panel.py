@@ -11,6 +11,7 @@ from PySide2.QtWidgets import QTableWidgetItem, QFileDialog, QMenu, QMessageBox
 
 from hexrd.ui.async_worker import AsyncWorker
 from hexrd.ui.cal_progress_dialog import CalProgressDialog
+from hexrd.ui import image_probe, image_stats
 from hexrd.ui.hexrd_config import HexrdConfig
 from hexrd.ui.image_file_manager import ImageFileManager
 from hexrd.ui.ui_loader import UiLoader
@@ -175,14 +176,15 @@ class LoadPanel(QObject):
                 return
 
         fnames = []
-        tmp_ims = []
+        probes = []
         for img in selected_files:
             f = os.path.split(img)[1]
             name = os.path.splitext(f)[0]
             if not self.ui.subdirectories.isChecked():
                 name = name.rsplit('_', 1)[0]
             if self.ext != '.yml':
-                tmp_ims.append(ImageFileManager().open_file(img))
+                # Only the headers are read
+                probes.append(image_probe.probe(img))
 
             fnames.append(name)
 
@@ -193,8 +195,7 @@ class LoadPanel(QObject):
 
         if self.ext == '.yml':
             for yf in self.yml_files[0]:
-                ims = ImageFileManager().open_file(yf)
-                self.total_frames.append(len(ims))
+                self.total_frames.append(image_probe.probe(yf).nframes)
 
             for f in self.files[0]:
                 with open(f, 'r') as raw_file:
@@ -207,24 +208,24 @@ class LoadPanel(QObject):
                     self.delta = [''] * len(self.yml_files[0])
                 self.empty_frames = data['options']['empty-frames']
         else:
-            for ims in tmp_ims:
-                has_omega = 'omega' in ims.metadata
-                self.total_frames.append(len(ims))
+            for result in probes:
+                has_omega = result.omega is not None
+                self.total_frames.append(result.nframes)
                 if has_omega:
-                    self.get_omega_data(ims)
+                    self.get_omega_data(result.omega, result.nframes)
                 else:
                     self.omega_min.append('')
                     self.omega_max.append('')
                     self.delta.append('')
 
-    def get_omega_data(self, ims):
-        minimum = ims.metadata['omega'][0][0]
-        size = len(ims.metadata['omega']) - 1
-        maximum = ims.metadata['omega'][size][1]
+    def get_omega_data(self, omega, nframes):
+        minimum = omega[0][0]
+        size = len(omega) - 1
+        maximum = omega[size][1]
 
         self.omega_min.append(minimum)
         self.omega_max.append(maximum)
-        self.delta.append((maximum - minimum)/len(ims))
+        self.delta.append((maximum - minimum)/nframes)
 
     def get_yaml_omega_data(self, data):
         if 'ostart' in data['meta']:
@@ -482,37 +483,69 @@ class LoadPanel(QObject):
         progress_dialog.setWindowTitle('Loading Processed Imageseries')
 
         # Start processing in background
-        worker = AsyncWorker(self.process_ims)
+        worker = AsyncWorker(self.process_ims, progress_callback=None)
         thread_pool.start(worker)
 
+        # Show the progress of the dark image computation, if any
+        def update_progress(value):
+            progress_dialog.setRange(0, 100)
+            progress_dialog.setValue(value)
+        worker.signals.progress.connect(update_progress)
+
         # On completion load imageseries nd close loading dialog
         worker.signals.result.connect(self.finish_processing_ims)
         worker.signals.finished.connect(progress_dialog.accept)
         progress_dialog.exec_()
 
-    def process_ims(self):
+    def process_ims(self, progress_callback=None):
         # Open selected images as imageseries
         det_names = HexrdConfig().get_detector_names()
+        HexrdConfig().frame_cache.clear()
+
+        # The detector files are opened concurrently
+        def progress(name, done, total):
+            msg = 'Opened ' + name + ' (%d/%d)' % (done, total)
+            HexrdConfig().emit_update_status_bar(msg)
+            if progress_callback is not None:
+                progress_callback.emit(int(done / total * 100))
 
         if len(self.files[0]) > 1:
+            args = []
             for i, det in enumerate(det_names):
                 if self.directories:
                     dirs = self.directories[i]
                 else:
                     dirs = self.parent_dir
-                ims = ImageFileManager().open_directory(dirs, self.files[i])
-                HexrdConfig().imageseries_dict[det] = ims
+                args.append((dirs, self.files[i]))
+
+            HexrdConfig().imageseries_dict.clear()
+            results, errors = ImageFileManager().open_concurrently(
+                det_names, ImageFileManager().open_directory, args, progress)
+            if not errors:
+                HexrdConfig().imageseries_dict.update(results)
         else:
-            ImageFileManager().load_images(det_names, self.files)
+            errors = ImageFileManager().load_images(det_names, self.files,
+                                                    progress)
+
+        if errors:
+            # They are shown by finish_processing_ims() on the GUI thread
+            return errors
 
         # Process the imageseries
-        self.apply_operations(HexrdConfig().imageseries_dict)
+        self.apply_operations(HexrdConfig().imageseries_dict,
+                              progress_callback)
         if self.state['agg']:
-            self.display_aggregation(HexrdConfig().imageseries_dict)
+            self.display_aggregation(HexrdConfig().imageseries_dict,
+                                     progress_callback)
         elif '' not in self.omega_min:
             self.add_omega_metadata(HexrdConfig().imageseries_dict)
 
-    def finish_processing_ims(self):
+    def finish_processing_ims(self, errors=None):
+        if errors:
+            # None of the partially opened imageseries were kept
+            ImageFileManager().show_errors(errors)
+            return
+
         # Display processed images on completion
         # The setEnabled options will not be needed once the panel
         # is complete - those dialogs will be removed.
@@ -520,9 +553,9 @@ class LoadPanel(QObject):
         self.parent().image_tab_widget.load_images()
         self.new_images_loaded.emit()
 
-    def apply_operations(self, ims_dict):
+    def apply_operations(self, ims_dict, progress_callback=None):
         # Apply the operations to the imageseries
-        for key in ims_dict.keys():
+        for i, key in enumerate(ims_dict.keys()):
             ops = []
             if self.state['dark'] != 5:
                 if not self.empty_frames and self.state['dark'] == 1:
@@ -531,7 +564,10 @@ class LoadPanel(QObject):
                     QMessageBox.warning(None, 'HEXRD', msg)
                     return
                 else:
-                    self.get_dark_op(ops, ims_dict[key])
+                    progress = self.detector_progress(
+                        progress_callback, i, len(ims_dict))
+                    self.get_dark_op(ops, ims_dict[key],
+                                     self.source_files(i), progress)
 
             if self.state['trans']:
                 self.get_flip_op(ops)
@@ -541,22 +577,46 @@ class LoadPanel(QObject):
             ims_dict[key] = imageseries.process.ProcessedImageSeries(
                 ims_dict[key], ops, frame_list=frames)
 
-    def get_dark_op(self, oplist, ims):
-        # Create or load the dark image if selected
+    def detector_progress(self, progress_callback, idx, num_dets):
+        # Map the progress of one detector onto the total progress
+        if progress_callback is None:
+            return None
+
+        def progress(fraction):
+            progress_callback.emit(int((idx + fraction) / num_dets * 100))
+        return progress
+
+    def source_files(self, idx):
+        # The files the imageseries of the detector was read from
+        if not self.files:
+            return []
+
+        files = list(self.files[idx])
+        if self.ext == '.yml':
+            files += self.yml_files[idx]
+        return files
+
+    def get_dark_op(self, oplist, ims, files=None, progress=None):
+        # Create or load the dark image if selected. The streaming stats
+        # are cached on disk, keyed on the source files.
         if self.state['dark'] != 4:
             frames = len(ims)
             if self.state['dark'] == 0:
-                darkimg = imageseries.stats.median(ims, frames)
+                stat = 'median'
             elif self.state['dark'] == 1:
-                darkimg = imageseries.stats.average(ims, self.empty_frames)
+                stat, frames = 'average', self.empty_frames
             elif self.state['dark'] == 2:
-                darkimg = imageseries.stats.average(ims, frames)
+                stat = 'average'
             else:
-                darkimg = imageseries.stats.max(ims, frames)
+                stat = 'max'
         else:
-            darkimg = imageseries.stats.median(
-                ImageFileManager().open_file(self.dark_file))
+            stat = 'median'
+            ims = ImageFileManager().open_file(self.dark_file)
+            frames = len(ims)
+            files = [self.dark_file]
 
+        darkimg = image_stats.compute(stat, ims, frames, files, progress,
+                                      params=self.hdf5_params(files))
         oplist.append(('dark', darkimg))
 
     def get_flip_op(self, oplist):
@@ -585,18 +645,46 @@ class LoadPanel(QObject):
         else:
             return range(self.empty_frames, len(ims))
 
-    def display_aggregation(self, ims_dict):
-        # Display aggregated image from imageseries
-        for key in ims_dict.keys():
-            if self.state['agg'] == 1:
-                ims_dict[key] = [imageseries.stats.max(
-                    ims_dict[key], len(ims_dict[key]))]
-            elif self.state['agg'] == 2:
-                ims_dict[key] = [imageseries.stats.median(
-                    ims_dict[key], len(ims_dict[key]))]
-            else:
-                ims_dict[key] = [imageseries.stats.average(
-                    ims_dict[key], len(ims_dict[key]))]
+    def hdf5_params(self, files):
+        # The datasets of an HDF5 file share the identity of the file, so
+        # the group and dataset that are read must be keyed on as well
+        exts = [os.path.splitext(f)[1] for f in files or []]
+        if any(ImageFileManager().is_hdf5(ext) for ext in exts):
+            return tuple(HexrdConfig().hdf5_path or ())
+        return ()
+
+    def processing_params(self, files=None):
+        # Everything besides the source files that the processed
+        # imageseries depends upon
+        params = (self.state['dark'], self.state['trans'], self.empty_frames,
+                  self.ext) + self.hdf5_params(files)
+        if self.state['dark'] == 4:
+            st = os.stat(self.dark_file)
+            params += (os.path.abspath(self.dark_file), st.st_size,
+                       st.st_mtime_ns)
+            params += self.hdf5_params([self.dark_file])
+        return params
+
+    def display_aggregation(self, ims_dict, progress_callback=None):
+        # Display aggregated image from imageseries. The aggregates are
+        # cached on disk, keyed on the source files and the processing.
+        if self.state['agg'] == 1:
+            stat = 'max'
+        elif self.state['agg'] == 2:
+            stat = 'median'
+        else:
+            stat = 'average'
+
+        for i, key in enumerate(ims_dict.keys()):
+            progress = self.detector_progress(
+                progress_callback, i, len(ims_dict))
+            files = self.source_files(i)
+            img = image_stats.compute(stat, ims_dict[key],
+                                      files=files,
+                                      progress=progress,
+                                      params=self.processing_params(files))
+            ims_dict[key] = imageseries.open(
+                None, 'array', data=np.array([img]))
 
     def add_omega_metadata(self, ims_dict):
         # Add on the omega metadata if there is any
@@ -1,3 +1,4 @@
+import copy
 import os
 
 from PySide2.QtCore import QEvent, QObject, Qt, QThreadPool, Signal
@@ -14,9 +15,14 @@ from hexrd.ui.color_map_editor import ColorMapEditor
 from hexrd.ui.cal_progress_dialog import CalProgressDialog
 from hexrd.ui.cal_tree_view import CalTreeView
 from hexrd.ui.calibration_crystal_editor import CalibrationCrystalEditor
+from hexrd.ui.calibration.polar_batch import write_polar_stack
 from hexrd.ui.calibration.powder_calibration import run_powder_calibration
+from hexrd.ui.calibration.warp_executor import (
+    EXECUTOR_TYPE_NAMES, EXECUTOR_TYPES
+)
 from hexrd.ui.hexrd_config import HexrdConfig
 from hexrd.ui.image_file_manager import ImageFileManager
+from hexrd.ui.lineout_waterfall_dialog import LineoutWaterfallDialog
 from hexrd.ui.load_images_dialog import LoadImagesDialog
 from hexrd.ui.load_panel import LoadPanel
 from hexrd.ui.materials_panel import MaterialsPanel
@@ -95,12 +101,22 @@ class MainWindow(QObject):
             self.on_action_save_materials_triggered)
         self.ui.action_export_polar_plot.triggered.connect(
             self.on_action_export_polar_plot_triggered)
+        self.ui.action_export_polar_stack.triggered.connect(
+            self.on_action_export_polar_stack_triggered)
         self.ui.action_edit_euler_angle_convention.triggered.connect(
             self.on_action_edit_euler_angle_convention)
         self.ui.action_edit_calibration_crystal.triggered.connect(
             self.on_action_edit_calibration_crystal)
         self.ui.action_edit_reset_instrument_config.triggered.connect(
             self.on_action_edit_reset_instrument_config)
+        self.ui.action_edit_warp_executor.triggered.connect(
+            self.on_action_edit_warp_executor)
+        self.ui.action_edit_calibration_executor.triggered.connect(
+            self.on_action_edit_calibration_executor)
+        self.ui.action_edit_frame_cache_size.triggered.connect(
+            self.on_action_edit_frame_cache_size)
+        self.ui.action_edit_raw_binary_format.triggered.connect(
+            self.on_action_edit_raw_binary_format)
         self.ui.action_show_live_updates.toggled.connect(
             self.live_update)
         self.ui.action_show_detector_borders.toggled.connect(
@@ -110,6 +126,8 @@ class MainWindow(QObject):
         self.image_mode_widget.tab_changed.connect(self.change_image_mode)
         self.ui.action_run_powder_calibration.triggered.connect(
             self.start_powder_calibration)
+        self.ui.action_run_azimuthal_lineouts.triggered.connect(
+            self.show_azimuthal_lineouts)
         self.load_widget.new_images_loaded.connect(self.new_images_loaded)
         self.new_images_loaded.connect(self.enable_editing_ims)
         self.new_images_loaded.connect(self.color_map_editor.update_bounds)
@@ -210,7 +228,12 @@ class MainWindow(QObject):
 
             if dialog.exec_():
                 detector_names, image_files = dialog.results()
-                ImageFileManager().load_images(detector_names, image_files)
+                errors = ImageFileManager().load_images(detector_names,
+                                                        image_files)
+                if errors:
+                    ImageFileManager().show_errors(errors)
+                    return
+
                 self.ui.action_edit_ims.setEnabled(True)
                 self.ui.action_edit_angles.setEnabled(True)
                 self.update_all()
@@ -230,7 +253,12 @@ class MainWindow(QObject):
             selected_dirs.append(d)
             images_dir = os.path.dirname(d)
 
-        ImageFileManager().load_aps_imageseries(detector_names, selected_dirs)
+        errors = ImageFileManager().load_aps_imageseries(detector_names,
+                                                         selected_dirs)
+        if errors:
+            ImageFileManager().show_errors(errors)
+            return
+
         self.ui.action_edit_ims.setEnabled(True)
         self.ui.action_edit_angles.setEnabled(True)
         self.update_all()
@@ -311,6 +339,41 @@ class MainWindow(QObject):
         if selected_file:
             return self.ui.image_tab_widget.export_polar_plot(selected_file)
 
+    def on_action_export_polar_stack_triggered(self):
+        if not HexrdConfig().has_images():
+            msg = ('No ImageSeries available for the polar transform.')
+            QMessageBox.warning(self.ui, 'HEXRD', msg)
+            return
+
+        selected_file, selected_filter = QFileDialog.getSaveFileName(
+            self.ui, 'Save Polar Stack', HexrdConfig().working_dir,
+            'NPY files (*.npy);; HDF5 files (*.h5 *.hdf5)')
+
+        if not selected_file:
+            return
+
+        HexrdConfig().emit_update_status_bar('Exporting polar stack...')
+
+        # Run the export in a background thread
+        worker = AsyncWorker(write_polar_stack, selected_file,
+                             progress_callback=None)
+        self.thread_pool.start(worker)
+
+        progress_dialog = CalProgressDialog(self.ui)
+        progress_dialog.setWindowTitle('Exporting Polar Stack')
+        progress_dialog.setRange(0, 100)
+        worker.signals.progress.connect(progress_dialog.setValue)
+        worker.signals.error.connect(self.polar_stack_export_failed)
+        worker.signals.finished.connect(progress_dialog.accept)
+        msg = 'Polar stack export finished!'
+        f = lambda result: HexrdConfig().emit_update_status_bar(msg)
+        worker.signals.result.connect(f)
+        progress_dialog.exec_()
+
+    def polar_stack_export_failed(self, error):
+        HexrdConfig().emit_update_status_bar('Polar stack export failed')
+        QMessageBox.critical(self.ui, 'HEXRD', str(error[1]))
+
     def enable_editing_ims(self):
         self.ui.action_edit_ims.setEnabled(HexrdConfig().has_images())
 
@@ -362,6 +425,90 @@ class MainWindow(QObject):
         HexrdConfig().restore_instrument_config_backup()
         self.update_config_gui()
 
+    def on_action_edit_warp_executor(self):
+        settings = self.select_executor('Select Warp Executor',
+                                        HexrdConfig().warp_executor_type,
+                                        HexrdConfig().warp_workers)
+        if settings is not None:
+            HexrdConfig().set_warp_executor(*settings)
+
+    def on_action_edit_calibration_executor(self):
+        settings = self.select_executor(
+            'Select Calibration Executor',
+            HexrdConfig().calibration_executor_type,
+            HexrdConfig().calibration_workers)
+        if settings is not None:
+            HexrdConfig().set_calibration_executor(*settings)
+
+    def select_executor(self, label, current_type, current_workers):
+        """Ask for an executor type and number of workers
+
+        Returns None if the user canceled.
+        """
+        types = EXECUTOR_TYPES
+        names = EXECUTOR_TYPE_NAMES
+        ind = types.index(current_type) if current_type in types else 0
+
+        name, ok = QInputDialog.getItem(self.ui, 'HEXRD', label, names, ind,
+                                        False)
+        if not ok:
+            # User canceled...
+            return None
+
+        executor_type = types[names.index(name)]
+
+        workers = 1
+        if executor_type != 'serial':
+            # 0 means to use all of the cores
+            workers, ok = QInputDialog.getInt(self.ui, 'HEXRD',
+                                              'Number of Workers (0 = all)',
+                                              current_workers, 0, 1024)
+            if not ok:
+                # User canceled...
+                return None
+
+        return executor_type, workers
+
+    def on_action_edit_frame_cache_size(self):
+        size, ok = QInputDialog.getInt(self.ui, 'HEXRD',
+                                       'Frame Cache Size (MB)',
+                                       HexrdConfig().frame_cache_size,
+                                       0, 1024 * 1024)
+        if not ok:
+            # User canceled...
+            return
+
+        HexrdConfig().set_frame_cache_size(size)
+
+    def on_action_edit_raw_binary_format(self):
+        options = copy.deepcopy(HexrdConfig().raw_binary_options)
+
+        dtypes = ['uint8', 'uint16', 'uint32', 'int16', 'int32', 'float32',
+                  'float64']
+        current = options['dtype']
+        ind = dtypes.index(current) if current in dtypes else 0
+        dtype, ok = QInputDialog.getItem(self.ui, 'HEXRD', 'Pixel Type',
+                                         dtypes, ind, False)
+        if not ok:
+            # User canceled...
+            return
+        options['dtype'] = dtype
+
+        labels = {
+            'header_size': 'Header Size (bytes)',
+            'rows': 'Rows',
+            'cols': 'Columns',
+        }
+        for key, label in labels.items():
+            value, ok = QInputDialog.getInt(self.ui, 'HEXRD', label,
+                                            options[key], 0, 2**31 - 1)
+            if not ok:
+                # User canceled...
+                return
+            options[key] = value
+
+        HexrdConfig().raw_binary_options = options
+
     def change_image_mode(self, text):
         self.image_mode = text.lower()
         self.update_image_mode_enable_states()
@@ -388,9 +535,14 @@ class MainWindow(QObject):
         HexrdConfig().emit_update_status_bar('Running powder calibration...')
 
         # Run the calibration in a background thread
-        worker = AsyncWorker(run_powder_calibration)
+        worker = AsyncWorker(run_powder_calibration, progress_callback=None)
         self.thread_pool.start(worker)
 
+        # Show the progress of the patch fits. The dialog goes back to
+        # the indeterminate state for the optimization.
+        self.cal_progress_dialog.setRange(0, 0)
+        worker.signals.progress.connect(self.update_calibration_progress)
+
         # Get the results and close the progress dialog when finished
         worker.signals.result.connect(self.finish_powder_calibration)
         worker.signals.finished.connect(self.cal_progress_dialog.accept)
@@ -399,6 +551,24 @@ class MainWindow(QObject):
         worker.signals.finished.connect(f)
         self.cal_progress_dialog.exec_()
 
+    def show_azimuthal_lineouts(self):
+        if not HexrdConfig().has_images():
+            msg = ('No images available for azimuthal integration.')
+            QMessageBox.warning(self.ui, 'HEXRD', msg)
+            return
+
+        # Keep a reference so the dialog is not garbage collected
+        self.lineout_waterfall_dialog = LineoutWaterfallDialog(self.ui)
+        self.lineout_waterfall_dialog.show()
+
+    def update_calibration_progress(self, value):
+        # Reaching the maximum would close the dialog
+        if value < 100:
+            self.cal_progress_dialog.setRange(0, 100)
+            self.cal_progress_dialog.setValue(value)
+        else:
+            self.cal_progress_dialog.setRange(0, 0)
+
     def finish_powder_calibration(self):
         self.update_config_gui()
         self.update_all()
@@ -18,6 +18,8 @@ class PowderCalibrationDialog:
         tth_tol = HexrdConfig().config['calibration']['powder']['tth_tol']
         eta_tol = HexrdConfig().config['calibration']['powder']['eta_tol']
         pk_type = HexrdConfig().config['calibration']['powder']['pk_type']
+        num_frames = HexrdConfig().config['calibration']['powder'].get(
+            'num_frames', 1)
 
         if pk_type == 'pvoigt':
             pk_type = 'PVoigt'
@@ -28,6 +30,13 @@ class PowderCalibrationDialog:
         self.ui.eta_tolerance.setValue(eta_tol)
         self.ui.peak_fit_type.setCurrentText(pk_type)
 
+        # Frames are averaged starting at the current frame
+        start = HexrdConfig().current_imageseries_idx
+        max_frames = min(len(HexrdConfig().imageseries(name)) - start
+                         for name in HexrdConfig().imageseries_dict)
+        self.ui.num_frames.setMaximum(max(max_frames, 1))
+        self.ui.num_frames.setValue(num_frames)
+
     def exec_(self):
         if not self.ui.exec_():
             return False
@@ -35,8 +44,11 @@ class PowderCalibrationDialog:
         tth_tol = self.ui.tth_tolerance.value()
         eta_tol = self.ui.eta_tolerance.value()
         pk_type = self.ui.peak_fit_type.currentText().lower()
+        num_frames = self.ui.num_frames.value()
 
         HexrdConfig().config['calibration']['powder']['tth_tol'] = tth_tol
         HexrdConfig().config['calibration']['powder']['eta_tol'] = eta_tol
         HexrdConfig().config['calibration']['powder']['pk_type'] = pk_type
+        HexrdConfig().config['calibration']['powder']['num_frames'] = (
+            num_frames)
         return True
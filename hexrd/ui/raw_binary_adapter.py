@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+
+from hexrd.imageseries.baseclass import ImageSeries
+
+from hexrd.ui.image_files_adapter import open_image_files
+
+GE_EXTS = ['.ge', '.ge1', '.ge2', '.ge3', '.ge4', '.ge5']
+RAW_EXTS = ['.raw', '.bin']
+
+# GE detector files are a fixed size header followed by raw frames
+GE_HEADER_SIZE = 8192
+GE_SHAPE = (2048, 2048)
+GE_DTYPE = np.dtype('<u2')
+
+
+def raw_binary_nframes(size, shape, dtype, header_size=0):
+    """The number of whole frames in a raw binary file of the given size"""
+    frame_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return max(int((size - header_size) // frame_size), 0)
+
+
+def open_raw_binary(path, shape, dtype, header_size=0):
+    """Create a memory-mapped imageseries from a raw binary file"""
+    return ImageSeries(RawBinaryAdapter(path, shape, dtype, header_size))
+
+
+def is_ge_layout(size):
+    """Whether a file of the given size is a standard GE file
+
+    That is, a GE header followed by whole frames of the GE shape and
+    dtype.
+    """
+    frame_size = int(np.prod(GE_SHAPE)) * GE_DTYPE.itemsize
+    data_size = size - GE_HEADER_SIZE
+    return data_size > 0 and data_size % frame_size == 0
+
+
+def open_ge(path):
+    """Memory-map a GE file, if it has the standard layout
+
+    Other GE variants have different headers or frame sizes, which
+    fabio reads from the header, so they are opened with fabio instead.
+    """
+    if not is_ge_layout(os.path.getsize(path)):
+        return open_image_files(os.path.dirname(path),
+                                [os.path.basename(path)])
+
+    return open_raw_binary(path, GE_SHAPE, GE_DTYPE, GE_HEADER_SIZE)
+
+
+class RawBinaryAdapter:
+    """Memory-mapped frames of a raw binary detector file
+
+    The file is a header of header_size bytes followed by frames of the
+    given shape and dtype. Opening the file only maps it, and each
+    frame is a read-only view of the mapping, so frames are read from
+    disk only when their pixels are accessed.
+    """
+
+    def __init__(self, path, shape, dtype, header_size=0):
+        self._dtype = np.dtype(dtype)
+        self._shape = tuple(shape)
+        self._meta = {}
+
+        nframes = raw_binary_nframes(os.path.getsize(path), self._shape,
+                                     self._dtype, header_size)
+        if nframes == 0:
+            raise Exception('No frames of shape %s and dtype %s in %s' %
+                            (self._shape, self._dtype, path))
+
+        self._frames = np.memmap(path, dtype=self._dtype, mode='r',
+                                 offset=header_size,
+                                 shape=(nframes,) + self._shape)
+
+    def __getitem__(self, key):
+        return self._frames[key]
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def metadata(self):
+        return self._meta
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        return self._shape
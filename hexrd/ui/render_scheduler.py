@@ -0,0 +1,74 @@
+from PySide2.QtCore import QObject
+
+from hexrd.ui.async_worker import AsyncWorker
+
+
+class RenderCancelled(Exception):
+    """Raised inside of a render job that has been superseded"""
+    pass
+
+
+class CancelToken(object):
+    """Cooperative cancel token passed into render jobs
+
+    Long running jobs should call check() between expensive steps, so
+    that they stop early once a newer job has been submitted.
+    """
+    def __init__(self, scheduler, generation):
+        self._scheduler = scheduler
+        self.generation = generation
+
+    @property
+    def cancelled(self):
+        return self.generation != self._scheduler.generation
+
+    def check(self):
+        if self.cancelled:
+            raise RenderCancelled()
+
+
+class RenderScheduler(QObject):
+    """Coalesce render jobs that run on AsyncWorkers
+
+    Every submitted job gets a new generation id, which supersedes all
+    previously submitted jobs. Superseded jobs are dropped before they
+    start, running ones are asked to stop through their cancel token,
+    and only the result of the newest job is delivered.
+    """
+    def __init__(self, thread_pool, parent=None):
+        super(RenderScheduler, self).__init__(parent)
+        self.thread_pool = thread_pool
+        self.generation = 0
+
+    def submit(self, fn, callback, *args, **kwargs):
+        """Run fn(*args, cancel_token=token, **kwargs) in the background
+
+        callback is called with the result only if no newer job has been
+        submitted in the meantime.
+        """
+        self.generation += 1
+        token = CancelToken(self, self.generation)
+
+        worker = AsyncWorker(self._run, token, fn, args, kwargs)
+        worker.signals.result.connect(
+            lambda result: self._deliver(token, callback, result))
+        self.thread_pool.start(worker)
+        return token
+
+    def cancel(self):
+        """Cancel all submitted jobs"""
+        self.generation += 1
+
+    def _run(self, token, fn, args, kwargs):
+        try:
+            # Drop the job without starting it if it has been superseded
+            token.check()
+            return fn(*args, cancel_token=token, **kwargs)
+        except RenderCancelled:
+            return None
+
+    def _deliver(self, token, callback, result):
+        if token.cancelled:
+            return
+
+        callback(result)
@@ -125,11 +125,12 @@ def select_merged_rings(selected_rings, indices, ranges):
     return new_indices, new_ranges
 
 
-def snip_width_pixels():
+def snip_width_pixels(pixel_size_tth=None):
 
     from hexrd.ui.hexrd_config import HexrdConfig
 
-    pixel_size_tth = HexrdConfig().polar_pixel_size_tth
+    if pixel_size_tth is None:
+        pixel_size_tth = HexrdConfig().polar_pixel_size_tth
     snip_width_deg = HexrdConfig().polar_snip1d_width
 
     # Convert the snip width into pixels using pixel_size_tth
@@ -137,13 +138,32 @@ def snip_width_pixels():
     return math.ceil(snip_width_deg / pixel_size_tth)
 
 
-def run_snip1d(img):
+def run_snip1d(img, pixel_size_tth=None):
 
     from hexrd.ui.hexrd_config import HexrdConfig
 
-    snip_width = snip_width_pixels()
+    snip_width = snip_width_pixels(pixel_size_tth)
     numiter = HexrdConfig().polar_snip1d_numiter
 
     # !!!: need a selector between
     # imageutil.fast_snip1d() and imageutil.snip1d()
     return imageutil.snip1d(img, snip_width, numiter)
+
+
+def panel_geometry_key(panel, tvec_s):
+    """Return a hashable key describing the geometry of a panel"""
+    key = (
+        panel.rows,
+        panel.cols,
+        panel.pixel_size_row,
+        panel.pixel_size_col,
+        tuple(np.ravel(panel.tvec)),
+        tuple(np.ravel(panel.rmat)),
+        tuple(np.ravel(panel.bvec)),
+        tuple(np.ravel(tvec_s)),
+    )
+    if panel.distortion is not None:
+        dfunc, dparams = panel.distortion[:2]
+        key += (getattr(dfunc, '__name__', repr(dfunc)),
+                tuple(np.ravel(dparams)))
+    return key
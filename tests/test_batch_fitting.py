@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from hexrd.ui.calibration import batch_fitting
+
+
+def make_patches(pktype):
+    x = np.tile(np.linspace(-1., 1., 41), (3, 1))
+    if pktype == 'gaussian':
+        p = np.array([
+            [10., 0.1, 0.3, 1., 0.5],
+            [5., -0.2, 0.5, 0., -1.],
+            [20., 0.3, 0.2, 2., 0.],
+        ])
+    else:
+        p = np.array([
+            [10., 0.1, 0.3, 0.2, 1., 0.5],
+            [5., -0.2, 0.5, 0.8, 0., -1.],
+            [20., 0.3, 0.2, 0.5, 2., 0.],
+        ])
+    return x, p
+
+
+@pytest.mark.parametrize('pktype', ['gaussian', 'pvoigt'])
+def test_fit_patches_recovers_parameters(pktype):
+    x, p = make_patches(pktype)
+    y = batch_fitting.pk_model(p, x, pktype)
+
+    result = batch_fitting.fit_patches(x, y, pktype)
+    np.testing.assert_allclose(result, p, rtol=1e-5, atol=1e-6)
+
+
+def test_fit_patches_with_noise():
+    x, p = make_patches('gaussian')
+    rng = np.random.default_rng(0)
+    y = batch_fitting.pk_model(p, x, 'gaussian')
+    y += rng.normal(scale=0.05, size=y.shape)
+
+    result = batch_fitting.fit_patches(x, y, 'gaussian')
+    np.testing.assert_allclose(result[:, :3], p[:, :3], rtol=0.05,
+                               atol=0.02)
+
+
+@pytest.mark.parametrize('pktype', ['gaussian', 'pvoigt'])
+def test_jacobian_matches_finite_differences(pktype):
+    x, p = make_patches(pktype)
+    jac = batch_fitting.pk_jacobian(p, x, pktype)
+
+    h = 1e-6
+    for i in range(p.shape[1]):
+        step = np.zeros_like(p)
+        step[:, i] = h
+        upper = batch_fitting.pk_model(p + step, x, pktype)
+        lower = batch_fitting.pk_model(p - step, x, pktype)
+        numeric = (upper - lower) / (2 * h)
+        np.testing.assert_allclose(jac[..., i], numeric, rtol=1e-5,
+                                   atol=1e-6)
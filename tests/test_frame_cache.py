@@ -0,0 +1,179 @@
+import time
+
+import numpy as np
+
+from hexrd.ui.frame_cache import FrameCache
+
+
+class CountingImageSeries:
+    """An imageseries that counts the reads of each frame"""
+
+    def __init__(self, nframes, shape=(4, 4)):
+        self.frames = [np.full(shape, i, dtype=np.float64)
+                       for i in range(nframes)]
+        self.reads = [0] * nframes
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        self.reads[idx] += 1
+        return self.frames[idx]
+
+
+FRAME_NBYTES = 4 * 4 * 8
+
+
+def test_get_caches_frames():
+    ims = CountingImageSeries(3)
+    cache = FrameCache(10 * FRAME_NBYTES)
+
+    np.testing.assert_array_equal(cache.get('a', ims, 1), ims.frames[1])
+    np.testing.assert_array_equal(cache.get('a', ims, 1), ims.frames[1])
+    assert ims.reads == [0, 1, 0]
+
+
+def test_lru_eviction_by_bytes():
+    ims = CountingImageSeries(4)
+    cache = FrameCache(2 * FRAME_NBYTES)
+
+    cache.get('a', ims, 0)
+    cache.get('a', ims, 1)
+    # Frame 0 is now the most recently used, so frame 1 gets evicted
+    cache.get('a', ims, 0)
+    cache.get('a', ims, 2)
+    assert ims.reads == [1, 1, 1, 0]
+
+    cache.get('a', ims, 0)
+    cache.get('a', ims, 1)
+    assert ims.reads == [1, 2, 1, 0]
+
+
+def test_replaced_imageseries_is_not_served():
+    old = CountingImageSeries(2)
+    new = CountingImageSeries(2)
+    new.frames[0] = new.frames[0] + 100
+    cache = FrameCache(10 * FRAME_NBYTES)
+
+    cache.get('a', old, 0)
+    np.testing.assert_array_equal(cache.get('a', new, 0), new.frames[0])
+    assert new.reads == [1, 0]
+
+
+def test_clear():
+    ims = CountingImageSeries(2)
+    cache = FrameCache(10 * FRAME_NBYTES)
+
+    cache.get('a', ims, 0)
+    cache.clear()
+    cache.get('a', ims, 0)
+    assert ims.reads == [2, 0]
+
+
+def test_set_max_bytes_evicts():
+    ims = CountingImageSeries(3)
+    cache = FrameCache(10 * FRAME_NBYTES)
+
+    for i in range(3):
+        cache.get('a', ims, i)
+
+    # Only the most recently used frame is kept
+    cache.set_max_bytes(FRAME_NBYTES)
+    cache.get('a', ims, 2)
+    cache.get('a', ims, 0)
+    assert ims.reads == [2, 1, 1]
+
+
+def test_frames_over_budget_are_not_cached():
+    ims = CountingImageSeries(1)
+    cache = FrameCache(FRAME_NBYTES // 2)
+
+    cache.get('a', ims, 0)
+    cache.get('a', ims, 0)
+    assert ims.reads == [2]
+
+
+def test_read_does_not_store():
+    ims = CountingImageSeries(2)
+    cache = FrameCache(10 * FRAME_NBYTES)
+
+    cache.read('a', ims, 0)
+    cache.read('a', ims, 0)
+    assert ims.reads == [2, 0]
+
+    # But it uses the frames that are already cached
+    cache.get('a', ims, 1)
+    cache.read('a', ims, 1)
+    assert ims.reads == [2, 1]
+
+
+def wait_for_prefetch(cache, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while cache._pending:
+        assert time.monotonic() < deadline, 'prefetching did not finish'
+        time.sleep(0.001)
+
+
+def cached_indices(cache):
+    return sorted(idx for _, idx in cache._frames)
+
+
+def test_prefetch_forward():
+    ims = CountingImageSeries(10)
+    cache = FrameCache(10 * FRAME_NBYTES, prefetch_count=2)
+
+    cache.get('a', ims, 0)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [0, 1, 2]
+
+    # The prefetched frame is not read again
+    cache.get('a', ims, 1)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [0, 1, 2, 3]
+    assert ims.reads == [1, 1, 1, 1, 0, 0, 0, 0, 0, 0]
+
+
+def test_prefetch_backward_and_clamped():
+    ims = CountingImageSeries(10)
+    cache = FrameCache(10 * FRAME_NBYTES, prefetch_count=2)
+
+    # Nothing is prefetched past the end of the imageseries
+    cache.get('a', ims, 9)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [9]
+
+    # Scrubbing backward prefetches the frames before
+    cache.get('a', ims, 8)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [6, 7, 8, 9]
+
+    cache.get('a', ims, 1)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [0, 1, 6, 7, 8, 9]
+    assert ims.reads == [1, 1, 0, 0, 0, 0, 1, 1, 1, 1]
+
+
+def test_prefetch_reverses_direction():
+    ims = CountingImageSeries(10)
+    cache = FrameCache(10 * FRAME_NBYTES, prefetch_count=2)
+
+    cache.get('a', ims, 5)
+    cache.get('a', ims, 6)
+    wait_for_prefetch(cache)
+    cache.get('a', ims, 5)
+    wait_for_prefetch(cache)
+    assert cached_indices(cache) == [3, 4, 5, 6, 7, 8]
+
+
+def test_prefetch_stays_within_budget():
+    ims = CountingImageSeries(10)
+    cache = FrameCache(3 * FRAME_NBYTES, prefetch_count=2)
+
+    for i in range(6):
+        cache.get('a', ims, i)
+        wait_for_prefetch(cache)
+        assert cache._nbytes <= cache.max_bytes
+
+    # The least recently used frames were evicted for the prefetched ones
+    assert cached_indices(cache) == [5, 6, 7]
+    assert ims.reads == [1, 1, 1, 1, 1, 1, 1, 1, 0, 0]
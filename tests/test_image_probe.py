@@ -0,0 +1,32 @@
+import numpy as np
+
+from hexrd import imageseries
+from hexrd.imageseries import save
+
+from hexrd.ui import image_probe
+
+
+def test_probe_frame_cache_written_by_hexrd(tmp_path):
+    data = np.zeros((3, 16, 24), dtype=np.uint16)
+    data[:, 4, 5] = 100
+    ims = imageseries.open(None, 'array', data=data)
+
+    yml = tmp_path / 'frames.yml'
+    save.write(ims, str(yml), 'frame-cache', threshold=0,
+               cache_file='frames.npz')
+
+    result = image_probe.probe(str(tmp_path / 'frames.npz'))
+    assert result.nframes == 3
+    assert tuple(result.shape) == (16, 24)
+    assert result.dtype == np.uint16
+
+
+def test_probe_frame_cache_bytes_dtype(tmp_path):
+    path = tmp_path / 'bytes.npz'
+    np.savez(path, shape=np.array([8, 8]), nframes=np.array(2),
+             dtype=np.array(b'float32'))
+
+    result = image_probe.probe(str(path))
+    assert result.nframes == 2
+    assert result.shape == (8, 8)
+    assert result.dtype == np.float32
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from hexrd.ui import image_stats
+
+
+def make_file(tmp_path, name='frames.npz'):
+    path = tmp_path / name
+    path.write_bytes(b'frames')
+    return str(path)
+
+
+def test_cache_key_is_stable(tmp_path):
+    f = make_file(tmp_path)
+    key = image_stats.cache_key('average', [f], 10, ('group', 'data'))
+    assert key == image_stats.cache_key('average', [f], 10,
+                                        ('group', 'data'))
+
+
+def test_cache_key_changes_with_params(tmp_path):
+    f = make_file(tmp_path)
+    key = image_stats.cache_key('average', [f], 10, ('group', 'data'))
+    assert key != image_stats.cache_key('average', [f], 10,
+                                        ('group', 'other'))
+    assert key != image_stats.cache_key('average', [f], 10)
+    assert key != image_stats.cache_key('median', [f], 10,
+                                        ('group', 'data'))
+
+
+def test_cache_key_changes_with_nframes(tmp_path):
+    f = make_file(tmp_path)
+    key = image_stats.cache_key('average', [f], 10)
+    assert key != image_stats.cache_key('average', [f], 11)
+
+
+def test_cache_key_changes_with_mtime(tmp_path):
+    f = make_file(tmp_path)
+    key = image_stats.cache_key('average', [f], 10)
+
+    st = os.stat(f)
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert key != image_stats.cache_key('average', [f], 10)
+
+
+def test_compute_reuses_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_stats, 'cache_dir',
+                        lambda: str(tmp_path / 'cache'))
+    f = make_file(tmp_path)
+    ims = np.arange(24, dtype=float).reshape(3, 2, 4)
+
+    result = image_stats.compute('average', ims, files=[f])
+    np.testing.assert_allclose(result, ims.mean(axis=0))
+
+    # The cached result is returned instead of recomputing it
+    cached = image_stats.compute('average', np.zeros_like(ims), files=[f])
+    np.testing.assert_allclose(cached, result)
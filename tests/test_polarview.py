@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from hexrd.ui import hexrd_config
+from hexrd.ui.calibration import polarview
+
+
+def make_config(apply_snip1d):
+    return SimpleNamespace(polar_apply_snip1d=apply_snip1d,
+                           polar_pixel_size_tth=0.1,
+                           polar_snip1d_width=0.5,
+                           polar_snip1d_numiter=2,
+                           show_detector_borders=False,
+                           polar_warp_engine='lookup')
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'snip1d'])
+def config(request, monkeypatch):
+    config = make_config(request.param)
+    # run_snip1d() imports the HexrdConfig itself
+    monkeypatch.setattr(polarview, 'HexrdConfig', lambda: config)
+    monkeypatch.setattr(hexrd_config, 'HexrdConfig', lambda: config)
+    return config
+
+
+def make_polar_view(raw_img):
+    pv = polarview.PolarView.__new__(polarview.PolarView)
+    pv.resolution_factor = 1
+    pv.min = 0.
+    pv.max = 1000.
+    pv.raw_img = raw_img.copy()
+    pv.raw_range = None
+    pv.img = None
+    pv.snip1d_background = None
+    pv.update_image()
+    return pv
+
+
+def make_raw_img():
+    rng = np.random.default_rng(0)
+    raw = rng.uniform(10., 20., size=(12, 40))
+    # Pin the intensity range outside of the updated rows
+    raw[0, 0] = 0.
+    raw[-1, -1] = 50.
+    return raw
+
+
+def assert_same_image(pv, expected):
+    np.testing.assert_allclose(pv.img, expected.img)
+    if expected.snip1d_background is None:
+        assert pv.snip1d_background is None
+    else:
+        np.testing.assert_allclose(pv.snip1d_background,
+                                   expected.snip1d_background)
+
+
+def test_region_update_matches_full_update(config):
+    raw = make_raw_img()
+    pv = make_polar_view(raw)
+
+    region = (slice(3, 6), slice(2, 7))
+    raw[region] += 5.
+    pv.raw_img[region] += 5.
+    pv.update_image(region)
+
+    assert_same_image(pv, make_polar_view(raw))
+
+
+def test_region_update_with_new_range(config):
+    raw = make_raw_img()
+    pv = make_polar_view(raw)
+
+    # The new maximum rescales every row
+    region = (slice(3, 6), slice(2, 7))
+    raw[region] = 100.
+    pv.raw_img[region] = 100.
+    pv.update_image(region)
+
+    assert_same_image(pv, make_polar_view(raw))
+
+
+def test_region_update_after_disabling_snip1d(monkeypatch):
+    config = make_config(True)
+    monkeypatch.setattr(polarview, 'HexrdConfig', lambda: config)
+    monkeypatch.setattr(hexrd_config, 'HexrdConfig', lambda: config)
+
+    raw = make_raw_img()
+    pv = make_polar_view(raw)
+
+    # The background must be removed from every row, not only the
+    # updated ones
+    config.polar_apply_snip1d = False
+    region = (slice(3, 6), slice(2, 7))
+    raw[region] += 5.
+    pv.raw_img[region] += 5.
+    pv.update_image(region)
+
+    assert_same_image(pv, make_polar_view(raw))
+
+
+def test_update_detector_swaps_the_warp(config):
+    shape = (12, 40)
+    old_warp = np.zeros(shape)
+    old_warp[2:5, 3:10] = 4.
+    new_warp = np.zeros(shape)
+    new_warp[4:8, 6:12] = 6.
+    other_warp = make_raw_img()
+
+    table = SimpleNamespace(bbox=(slice(4, 8), slice(6, 12)),
+                            warp=lambda img: new_warp)
+
+    pv = polarview.PolarView.__new__(polarview.PolarView)
+    pv.resolution_factor = 1
+    pv.min = 0.
+    pv.max = 1000.
+    pv.images_dict = {'a': np.zeros((2, 2)), 'b': np.zeros((2, 2))}
+    pv.lookup_table = lambda det: table
+    pv.warp_dict = {'a': old_warp, 'b': other_warp}
+    pv.warp_bboxes = {'a': (slice(2, 5), slice(3, 10)), 'b': None}
+    pv.raw_range = None
+    pv.img = None
+    pv.snip1d_background = None
+    pv.raw_img = old_warp + other_warp
+    pv.update_image()
+
+    pv.update_detector('a', instr=None)
+
+    np.testing.assert_allclose(pv.raw_img, new_warp + other_warp)
+    assert pv.warp_bboxes['a'] == table.bbox
+    assert_same_image(pv, make_polar_view(new_warp + other_warp))
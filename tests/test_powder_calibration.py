@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from hexrd.ui.calibration import powder_calibration
+
+
+def make_instrument(num_instr=7, panel_size=6, num_panels=2, flags=None):
+    detectors = {
+        'panel_%d' % i: SimpleNamespace(
+            calibration_parameters=np.zeros(panel_size))
+        for i in range(num_panels)
+    }
+    nparams = num_instr + panel_size * num_panels
+    if flags is None:
+        flags = np.ones(nparams, dtype=bool)
+    return SimpleNamespace(detectors=detectors,
+                           calibration_parameters=np.zeros(nparams),
+                           calibration_flags=np.asarray(flags, dtype=bool))
+
+
+def test_parameter_indices():
+    instr = make_instrument()
+    indices = powder_calibration.parameter_indices(instr)
+
+    assert list(indices) == ['panel_0', 'panel_1']
+    np.testing.assert_array_equal(indices['panel_0'],
+                                  list(range(7)) + list(range(7, 13)))
+    np.testing.assert_array_equal(indices['panel_1'],
+                                  list(range(7)) + list(range(13, 19)))
+
+
+def test_panel_parameter_indices():
+    instr = make_instrument()
+    indices = powder_calibration.parameter_indices(instr, shared=False)
+
+    np.testing.assert_array_equal(indices['panel_0'], range(7, 13))
+    np.testing.assert_array_equal(indices['panel_1'], range(13, 19))
+
+
+def test_parameter_indices_mismatch():
+    instr = make_instrument()
+    instr.calibration_parameters = np.zeros(5)
+
+    with pytest.raises(Exception):
+        powder_calibration.parameter_indices(instr)
+
+
+def test_jac_sparsity():
+    # Refine one instrument parameter, and one parameter of each panel
+    flags = np.zeros(19, dtype=bool)
+    flags[[0, 8, 15]] = True
+    instr = make_instrument(flags=flags)
+
+    num_points = {'panel_0': 2, 'panel_1': 1}
+    sparsity = powder_calibration.jac_sparsity(instr, num_points)
+
+    expected = np.array([
+        [1, 1, 0],
+        [1, 1, 0],
+        [1, 1, 0],
+        [1, 1, 0],
+        [1, 0, 1],
+        [1, 0, 1],
+    ])
+    np.testing.assert_array_equal(sparsity.toarray(), expected)
+
+
+def test_num_refined_panels():
+    flags = np.zeros(19, dtype=bool)
+    flags[[0, 8]] = True
+    instr = make_instrument(flags=flags)
+    calibrator = SimpleNamespace(instr=instr)
+
+    num_refined_panels = powder_calibration.PowderCalibrator.\
+        num_refined_panels
+    data_dict = {'panel_0': np.zeros((3, 2)), 'panel_1': np.zeros((3, 2))}
+    assert num_refined_panels(calibrator, data_dict) == 1
+
+    # Shared instrument parameters do not count
+    instr.calibration_flags[8] = False
+    assert num_refined_panels(calibrator, data_dict) == 0
+
+    instr.calibration_flags[[8, 15]] = True
+    assert num_refined_panels(calibrator, data_dict) == 2
+
+    # Panels without measured points do not count
+    data_dict['panel_1'] = np.zeros((0, 2))
+    assert num_refined_panels(calibrator, data_dict) == 1